@@ -0,0 +1,119 @@
+"""Offline micro-benchmarks for the exam bot.
+
+Usage: python bench.py [parse] [startup] [--lines N] [--exams N]
+
+`startup` times a cold start in fresh interpreters against the fake Bot API:
+importing the telegram stack and main, answering a first /start, the
+reminder index being ready and then a /myexams, once from exams.json and
+once from a SCHEDULE_SNAPSHOT.
+"""
+import argparse, asyncio, datetime, json, os, random, subprocess, sys, tempfile, time
+
+
+def timetable_lines(count):
+    months = ["August", "Aug", "September", "Sept.", "October"]
+    rows = []
+    for i in range(count):
+        month = random.choice(months)
+        day = random.randint(1, 28)
+        kind = i % 4
+        if kind == 0:
+            rows.append(f"{300 + i % 100}–{month} {day}th({random.randint(1, 12)}:30pm)–(Online)")
+        elif kind == 1:
+            rows.append(f"CS-{100 + i % 100} - {month} {day} ({random.randint(7, 18):02d}:00) - Room B")
+        elif kind == 2:
+            rows.append(f"MATH {i},2026-10-{day:02d},{random.randint(7, 18)}:15,Great Hall")
+        else:
+            rows.append(f"STAT {i}\t{day} {month} 2026\t9.30am\tJQB 19")
+    return "\n".join(rows)
+
+
+def bench_parse(lines, repeat=20):
+    import main
+    text = timetable_lines(lines)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = main.parse_timetable(text, chat_id=1)
+        best = min(best, time.perf_counter() - start)
+    print(f"parse_timetable: {lines} lines in {best * 1000:.2f} ms "
+          f"({lines / best:,.0f} lines/s, {len(result.exams)} parsed, {len(result.failed)} failed)")
+    start = time.perf_counter()
+    main.render_timetable_result(result)
+    print(f"render_timetable_result: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+
+def exam_entries(count, chats):
+    start = datetime.datetime.now().replace(second=0, microsecond=0) + datetime.timedelta(days=1)
+    return [
+        {
+            "id": n,
+            "chat_id": random.randint(1, chats),
+            "time": (start + datetime.timedelta(minutes=random.randint(0, 60 * 24 * 90))).isoformat(),
+            "message": f"{300 + n % 100} (Online)",
+        }
+        for n in range(1, count + 1)
+    ]
+
+
+async def startup_child():
+    """One cold start, run by bench_startup in a fresh interpreter; prints a JSON line of timings."""
+    import fake_telegram, loadtest
+    server, _ = fake_telegram.serve(0)
+    os.environ["TELEGRAM_API_URL"] = f"http://127.0.0.1:{server.server_port}/bot"
+    started = time.perf_counter()
+    # Timed apart from main: it is most of the import and main cannot defer it
+    import telegram.ext
+    from telegram import Update
+    timings = {"telegram": time.perf_counter() - started}
+    import main
+    timings["import"] = time.perf_counter() - started
+    app = main.build_application(updater=None)
+    main.add_handlers(app)
+    await app.initialize()
+    await main.start_reminder(app)
+    await app.process_update(Update.de_json(loadtest.message_update(1, 1, "/start"), app.bot))
+    timings["/start"] = time.perf_counter() - started
+    # /myexams only after the index: an earlier one would load the store
+    # alongside it and blur what the snapshot saves
+    await main.scheduler.ready.wait()
+    timings["index"] = time.perf_counter() - started
+    await app.process_update(Update.de_json(loadtest.message_update(2, 1, "/myexams"), app.bot))
+    timings["/myexams"] = time.perf_counter() - started
+    timings["exams"] = len(main.scheduler.pending)
+    await main.stop_reminder(app)
+    await app.shutdown()
+    server.shutdown()
+    print(json.dumps(timings))
+
+
+def bench_startup(exams, chats=None):
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    with open(os.path.join(workdir, "exams.json"), "w") as f:
+        json.dump(exam_entries(exams, chats or max(1, exams // 5)), f, indent=4)
+    env = dict(os.environ, TOKEN="123:bench", BENCH_STARTUP_CHILD="1", EXAM_STORE="json", WORKERS="1")
+    env.pop("SCHEDULE_SNAPSHOT", None)
+    runs = [("exams.json", env), ("write snapshot", dict(env, SCHEDULE_SNAPSHOT="schedule.snapshot"))]
+    runs.append(("from snapshot", runs[-1][1]))
+    print(f"startup: {exams} exams, times since the first import (in {workdir})")
+    for label, run_env in runs:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__)], cwd=workdir, env=run_env,
+                               capture_output=True, text=True, check=True)
+        t = json.loads(child.stdout.splitlines()[-1])
+        print(f"  {label:<15} telegram {t['telegram'] * 1000:6.1f} ms   import main {t['import'] * 1000:6.1f} ms   first reply {t['/start'] * 1000:7.1f} ms"
+              f"   index ready {t['index'] * 1000:7.1f} ms ({t['exams']} exams)   then /myexams {t['/myexams'] * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("benchmarks", nargs="*", default=["parse"])
+    parser.add_argument("--lines", type=int, default=1000)
+    parser.add_argument("--exams", type=int, default=100000, help="exams in the startup benchmark's store")
+    if os.environ.get("BENCH_STARTUP_CHILD"):
+        sys.exit(asyncio.run(startup_child()))
+    args = parser.parse_args()
+    random.seed(0)
+    if "parse" in args.benchmarks:
+        bench_parse(args.lines)
+    if "startup" in args.benchmarks:
+        bench_startup(args.exams)
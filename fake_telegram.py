@@ -0,0 +1,178 @@
+"""A tiny stand-in for the Telegram Bot API, for local multi-process and load testing.
+
+Run it, then point the bot at it:
+
+    python fake_telegram.py --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081/bot EXAM_STORE=sqlite WORKERS=3 python main.py
+
+Control endpoints (outside the /bot<token>/ namespace):
+    POST /inject   queue an Update (JSON body) for getUpdates
+    GET  /sent     JSON list of every recorded bot call
+    POST /reset    clear queued updates and recorded calls
+"""
+import argparse, json, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class FakeTelegram:
+    """In-memory Bot API state with configurable latency and 429 injection.
+
+    Every `flood_every`-th call to a sending method fails with 429 and
+    `retry_after` seconds, like Telegram's flood control.
+    """
+
+    SENDING = {"sendMessage", "editMessageText", "answerCallbackQuery"}
+
+    def __init__(self, latency=0.0, flood_every=0, retry_after=1):
+        self.latency = latency
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.lock = threading.Condition()
+        self.updates = []
+        self.calls = []
+        self.next_update_id = 1
+        self.next_message_id = 1
+        self.sending_calls = 0
+        self.flooded = 0
+
+    def inject(self, update):
+        with self.lock:
+            update.setdefault("update_id", self.next_update_id)
+            self.next_update_id = max(self.next_update_id, update["update_id"]) + 1
+            self.updates.append(update)
+            self.lock.notify_all()
+
+    def reset(self):
+        with self.lock:
+            self.updates.clear()
+            self.calls.clear()
+            self.sending_calls = 0
+            self.flooded = 0
+
+    def sent(self, since=0):
+        with self.lock:
+            return self.calls[since:]
+
+    def call(self, method, params):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if method in self.SENDING:
+                self.sending_calls += 1
+                if self.flood_every and self.sending_calls % self.flood_every == 0:
+                    self.flooded += 1
+                    return 429, {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {self.retry_after}",
+                        "parameters": {"retry_after": self.retry_after},
+                    }
+                self.calls.append({"method": method, "time": time.time(), **params})
+        if method == "getUpdates":
+            return 200, {"ok": True, "result": self._get_updates(params)}
+        return 200, {"ok": True, "result": self._result(method, params)}
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        with self.lock:
+            # Confirm everything before the offset, then long-poll for the rest
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates and time.monotonic() < deadline:
+                self.lock.wait(deadline - time.monotonic())
+            return list(self.updates)
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if method in ("sendMessage", "editMessageText"):
+            with self.lock:
+                message_id = params.get("message_id") or self.next_message_id
+                self.next_message_id += 1
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": params.get("chat_id", 0), "type": "private"},
+                "text": str(params.get("text", "")),
+            }
+        return True
+
+
+def make_handler(api):
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, so the bot's connection pool is not reconnecting on every call;
+        # without TCP_NODELAY the split header/body writes stall on delayed ACKs
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _params(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                return json.loads(raw or b"{}")
+            params = {}
+            for name, values in parse_qs(raw.decode()).items():
+                # The bot library JSON-encodes every non-string parameter
+                try:
+                    params[name] = json.loads(values[0])
+                except ValueError:
+                    params[name] = values[0]
+            return params
+
+        def do_GET(self):
+            path = urlparse(self.path).path
+            if path == "/sent":
+                return self._reply(200, api.sent())
+            self.do_POST()
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            if path == "/inject":
+                api.inject(self._params())
+                return self._reply(200, {"ok": True})
+            if path == "/reset":
+                api.reset()
+                return self._reply(200, {"ok": True})
+            if not path.startswith("/bot"):
+                return self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+            method = path.rsplit("/", 1)[-1]
+            status, payload = api.call(method, self._params())
+            self._reply(status, payload)
+
+    return Handler
+
+
+def serve(port=8081, api=None, host="127.0.0.1"):
+    """Start the fake API in a background thread and return (server, api)."""
+    api = api or FakeTelegram()
+    server = ThreadingHTTPServer((host, port), make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, api
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every call")
+    parser.add_argument("--flood-every", type=int, default=0, help="answer every Nth send with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+    server, _ = serve(args.port, FakeTelegram(args.latency, args.flood_every, args.retry_after))
+    print(f"Fake Telegram Bot API on http://127.0.0.1:{args.port}/bot<token>/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
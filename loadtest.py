@@ -0,0 +1,211 @@
+"""Load tests: the real bot Application against the fake Bot API in fake_telegram.py.
+
+Usage:
+    python loadtest.py handlers [--users N] [--ops N] [--trace FILE] [--save-trace FILE]
+    python loadtest.py storm [--exams N] [--chats N] [--spread SECONDS]
+
+`handlers` replays a trace of /addexam, /myexams, /deleteexam and inline
+delete callbacks (synthetic unless --trace names a JSON-lines file of
+Updates) and reports p50/p99 latency per handler. `storm` loads N exams
+whose 1-hour reminder falls due within --spread seconds and reports how
+late each reminder was and the messages per second.
+
+Both run in a temporary directory with their own store, so exams.json is
+never touched. --latency, --flood-every and --retry-after shape the fake
+API; --send-rate lifts the bot's own rate limit so the bot, not Telegram's
+30 msg/s, is what gets measured.
+"""
+import argparse, asyncio, datetime, json, logging, os, random, re, sys, tempfile, time
+
+import fake_telegram
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def message_update(n, chat_id, text):
+    command = text.split()[0]
+    return {
+        "update_id": n,
+        "message": {
+            "message_id": n,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+def callback_update(n, chat_id, data):
+    return {
+        "update_id": n,
+        "callback_query": {
+            "id": str(n),
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {"message_id": n, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}},
+        },
+    }
+
+
+def synthetic_trace(users, ops, seed=0):
+    """A mix of adds, listings and deletes; deletes only target exams that exist.
+
+    A fresh store numbers exams 1, 2, ... in the order they are added, so the
+    trace can name them in delete buttons.
+    """
+    rng = random.Random(seed)
+    year = datetime.date.today().year + 1
+    saved = {}      # chat_id -> exam IDs in /myexams order
+    next_id = 1
+    trace = []
+    for n in range(1, ops + 1):
+        chat_id = rng.randint(1, users)
+        kind = rng.choices(["addexam", "myexams", "deleteexam", "callback"], weights=[4, 3, 1, 1])[0]
+        if kind in ("deleteexam", "callback") and not saved.get(chat_id):
+            kind = "addexam"
+        if kind == "addexam":
+            day = rng.randint(1, 28)
+            trace.append(message_update(n, chat_id, f"/addexam MATH {n},{year}-{rng.randint(1, 12):02d}-{day:02d},{rng.randint(7, 18)}:00,Hall {n % 7}"))
+            saved.setdefault(chat_id, []).append(next_id)
+            next_id += 1
+        elif kind == "myexams":
+            trace.append(message_update(n, chat_id, "/myexams"))
+        elif kind == "deleteexam":
+            position = rng.randint(1, len(saved[chat_id]))
+            trace.append(message_update(n, chat_id, f"/deleteexam {position}"))
+            del saved[chat_id][position - 1]
+        else:
+            exam_id = saved[chat_id].pop(rng.randrange(len(saved[chat_id])))
+            trace.append(callback_update(n, chat_id, f"del_{exam_id}"))
+    return trace
+
+
+def update_kind(data):
+    if "callback_query" in data:
+        return "callback:" + data["callback_query"]["data"].split("_", 1)[0]
+    return data["message"]["text"].split()[0].lstrip("/")
+
+
+async def run_handlers(main, app, api, args):
+    from telegram import Update
+    if args.trace:
+        with open(args.trace) as f:
+            trace = [json.loads(line) for line in f if line.strip()]
+    else:
+        trace = synthetic_trace(args.users, args.ops)
+    if args.save_trace:
+        with open(args.save_trace, "w") as f:
+            f.writelines(json.dumps(data) + "\n" for data in trace)
+    latencies = {}
+    started = time.perf_counter()
+    for data in trace:
+        update = Update.de_json(data, app.bot)
+        start = time.perf_counter()
+        await app.process_update(update)
+        latencies.setdefault(update_kind(data), []).append(time.perf_counter() - start)
+    elapsed = time.perf_counter() - started
+    print(f"handlers: {len(trace)} updates in {elapsed:.2f}s ({len(trace) / elapsed:,.0f} updates/s), "
+          f"{len(api.sent())} API calls, {api.flooded} answered with 429")
+    for kind, values in sorted(latencies.items()):
+        print(f"  {kind:<20} n={len(values):<7} p50 {percentile(values, 0.5) * 1000:7.2f} ms"
+              f"   p99 {percentile(values, 0.99) * 1000:7.2f} ms")
+
+
+async def run_storm(main, app, api, args):
+    chats = args.chats or args.exams
+    # Pick the 1-hour offset: earlier ones are marked sent, as if delivered days ago
+    offset = main.REMINDER_OFFSETS.index(datetime.timedelta(hours=1))
+    lead = args.lead if args.lead is not None else 5 + args.exams / 50000
+    first_due = datetime.datetime.now().replace(microsecond=0) + datetime.timedelta(seconds=lead)
+    due = {}
+    exams = []
+    for n in range(args.exams):
+        at = first_due + datetime.timedelta(seconds=args.spread * n / args.exams)
+        due[n] = at.timestamp()
+        exams.append(main.Exam(n % chats + 1, at + main.REMINDER_OFFSETS[offset], f"STORM {n}", sent=(1 << offset) - 1))
+    loading = time.perf_counter()
+    for i in range(0, len(exams), 10000):
+        await main.store.add_many(exams[i:i + 10000])
+    print(f"storm: stored {args.exams} exams for {chats} chats in {time.perf_counter() - loading:.2f}s")
+    loop_task = asyncio.create_task(main.reminder_loop(app))
+    deadline = time.time() + lead + args.spread + args.timeout
+    subject = re.compile(r"STORM (\d+)")
+    late, seen, sends = [], set(), []
+    while len(seen) < args.exams and time.time() < deadline:
+        await asyncio.sleep(0.5)
+        for call in api.sent(len(sends)):
+            sends.append(call)
+            if call["method"] != "sendMessage":
+                continue
+            for n in map(int, subject.findall(call.get("text", ""))):
+                if n not in seen:
+                    seen.add(n)
+                    late.append(call["time"] - due[n])
+    loop_task.cancel()
+    await asyncio.gather(loop_task, return_exceptions=True)
+    await main.send_queue.stop()
+    messages = [call["time"] for call in sends if call["method"] == "sendMessage"]
+    span = (max(messages) - min(messages)) if len(messages) > 1 else 0
+    print(f"storm: {len(seen)}/{args.exams} reminders in {len(messages)} messages, {api.flooded} answered with 429")
+    print(f"  lateness vs REMINDER_OFFSETS  p50 {percentile(late, 0.5):.3f}s   p99 {percentile(late, 0.99):.3f}s"
+          f"   max {max(late, default=0):.3f}s")
+    print(f"  throughput {len(messages) / span if span else 0:,.0f} msg/s")
+
+
+async def run(args):
+    # main reads its configuration at import time, so set it up first
+    server, api = fake_telegram.serve(args.port, fake_telegram.FakeTelegram(args.latency, args.flood_every, args.retry_after))
+    os.environ.update({
+        "TOKEN": "123:loadtest",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{server.server_port}/bot",
+        "EXAM_STORE": args.store,
+        "SEND_RATE": str(args.send_rate),
+        "WORKERS": "1",
+    })
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    os.chdir(workdir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import main
+    app = main.build_application(updater=None)
+    main.add_handlers(app)
+    try:
+        async with app:
+            if args.test == "handlers":
+                await run_handlers(main, app, api, args)
+            else:
+                await run_storm(main, app, api, args)
+    finally:
+        await main.store.close()
+        main.scheduler.outbox.close()
+        server.shutdown()
+    print(f"  (store and ledger left in {workdir})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("test", choices=["handlers", "storm"])
+    parser.add_argument("--store", choices=["json", "sqlite"], default="json")
+    parser.add_argument("--port", type=int, default=0, help="fake API port (default: any free one)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds the fake API adds to every call")
+    parser.add_argument("--flood-every", type=int, default=0, help="answer every Nth send with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--send-rate", type=float, default=1e6, help="bot-wide messages per second")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=5000)
+    parser.add_argument("--trace", help="JSON-lines file of Updates to replay instead of a synthetic trace")
+    parser.add_argument("--save-trace", help="write the replayed trace here")
+    parser.add_argument("--exams", type=int, default=10000)
+    parser.add_argument("--chats", type=int, default=0, help="spread storm exams over this many chats (default: one each)")
+    parser.add_argument("--spread", type=float, default=10.0, help="seconds over which storm reminders fall due")
+    parser.add_argument("--lead", type=float, help="seconds before the first reminder is due (default scales with --exams)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds to wait for stragglers")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(0)
+    asyncio.run(run(args))
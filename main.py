@@ -14,7 +14,9 @@ async def unknown(update, context):
         "• `/myexams` — View all your exams\n"
         "• `/deleteexam <number>` — Remove a saved exam\n"
         "• `/nextexam` — Show your closest upcoming exam\n"
-        "• `/today` — Show exams happening today\n",
+        "• `/today` — Show exams happening today\n"
+        "• `/subscribe <course>` — Follow a published course timetable\n"
+        "• Send a `.csv` or `.ics` file — Import a whole timetable\n",
         parse_mode="Markdown",
         reply_markup=reply_markup
     )
@@ -45,36 +47,47 @@ async def newexam_time(update, context):
 async def newexam_location(update, context):
     context.user_data['location'] = update.message.text.strip()
     # Parse date and time
-    import re
-    from datetime import datetime
-    months = {m: i+1 for i, m in enumerate(["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"])}
-    date_match = re.match(r"(\d+)[a-z]* ([A-Za-z]+) (\d{4})", context.user_data['date'])
+    date_match = GUIDED_DATE.match(context.user_data['date'])
     if not date_match:
         await update.message.reply_text("⚠️ Invalid date format. Please use e.g. 29th August 2025.")
         return ConversationHandler.END
     day, month_str, year = date_match.groups()
-    month = months.get(month_str)
+    month = MONTHS.get(month_str.lower())
     if not month:
         await update.message.reply_text("⚠️ Invalid month. Please use e.g. August.")
         return ConversationHandler.END
     # Parse time
     time_str = context.user_data['time'].replace(' ', '')
     try:
-        if re.search(r'[AaPp][Mm]$', time_str):
-            dt = datetime.strptime(f"{year} {month} {day} {time_str}", "%Y %m %d %I:%M%p")
+        if time_str[-2:].lower() in ("am", "pm"):
+            dt = datetime.datetime.strptime(f"{year} {month} {day} {time_str}", "%Y %m %d %I:%M%p")
         else:
             hour, minute = map(int, time_str.split(":"))
-            dt = datetime(int(year), month, int(day), hour, minute)
+            dt = datetime.datetime(int(year), month, int(day), hour, minute)
     except Exception:
         await update.message.reply_text("⚠️ Invalid time format. Please use e.g. 7:30pm or 14:00.")
         return ConversationHandler.END
+    exam = Exam(update.effective_chat.id, dt, f"{context.user_data['subject']} {context.user_data['location']}".strip())
+    await store.add(exam)
+    scheduler.add(exam)
+    await update.message.reply_text(
+        f"✅ *Exam saved:* {exam.message}\n*Date:* `{dt.strftime('%Y-%m-%d %H:%M')}`",
+        parse_mode="Markdown"
+    )
+    return ConversationHandler.END
 
 async def newexam_cancel(update, context):
     await update.message.reply_text("Exam creation cancelled.")
     return ConversationHandler.END
 from telegram import ReplyKeyboardMarkup, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram import ReplyKeyboardMarkup
-import datetime, json, os, asyncio
+from telegram.error import BadRequest, Forbidden, RetryAfter
+import datetime, json, os, re, csv, asyncio, bisect, heapq, itertools, functools, logging, marshal, socket, tempfile, time, zlib
+import urllib.parse
+# Optional backends (sqlite3, tornado for /metrics, multiprocessing for
+# WORKERS) are imported where they are used, so a default start skips them.
+# The telegram stack above is most of what `import main` still costs; every
+# handler needs it, so deferring it would only move the wait to the first update
+from typing import NamedTuple
 
 def get_token():
     token = os.getenv("TOKEN")
@@ -88,17 +101,736 @@ def get_token():
 
 TOKEN = get_token()
 EXAMS_FILE = "exams.json"
+# Next exam ID to hand out. IDs of deleted exams are never reused, so it can't
+# be worked out from exams.json alone: a stale delete button would hit a new exam
+EXAM_IDS_FILE = "exam_ids.json"
+
+# ---------------- Metrics ----------------
+# Set METRICS=1 to collect Prometheus metrics and serve them on /metrics
+METRICS = os.getenv("METRICS", "") not in ("", "0")
+# Port of the standalone /metrics server used when polling (webhooks share PORT)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
+
+class Metrics:
+    """Counters, gauges and histograms rendered in the Prometheus text format.
+
+    Every method returns at once when disabled, and handlers are only
+    wrapped for timing (timed()) at registration time when enabled.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.kinds = {}        # name -> (type, help)
+        self.counters = {}     # (name, labels) -> value
+        self.gauges = {}       # (name, labels) -> value, or a callable returning it
+        self.histograms = {}   # (name, labels) -> [count per bucket..., +Inf, sum, count]
+
+    def describe(self, name, kind, text):
+        self.kinds[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            key = name, tuple(sorted(labels.items()))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if self.enabled:
+            self.gauges[name, tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        key = name, tuple(sorted(labels.items()))
+        counts = self.histograms.get(key)
+        if counts is None:
+            counts = self.histograms[key] = [0] * (len(self.BUCKETS) + 3)
+        counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def timed(self, name, callback, **labels):
+        """Wrap an async callback to observe its duration; unchanged when disabled."""
+        if not self.enabled:
+            return callback
+        @functools.wraps(callback)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            finally:
+                self.observe(name, time.perf_counter() - start, **labels)
+        return wrapper
+
+    def render(self):
+        def fmt(labels):
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}" if labels else ""
+        # Snapshot first: the polling-mode server renders from another thread
+        counters = list(self.counters.items())
+        gauges = list(self.gauges.items())
+        histograms = list(self.histograms.items())
+        lines = []
+        for name, (kind, text) in sorted(self.kinds.items()):
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                lines.extend(f"{name}{fmt(labels)} {value}" for (n, labels), value in counters if n == name)
+            elif kind == "gauge":
+                for (n, labels), value in gauges:
+                    if n == name:
+                        lines.append(f"{name}{fmt(labels)} {value() if callable(value) else value}")
+            else:
+                for (n, labels), counts in histograms:
+                    if n != name:
+                        continue
+                    total = 0
+                    for le, count in zip(self.BUCKETS + ("+Inf",), counts):
+                        total += count
+                        lines.append(f"{name}_bucket{fmt(labels + (('le', le),))} {total}")
+                    lines.append(f"{name}_sum{fmt(labels)} {counts[-2]}")
+                    lines.append(f"{name}_count{fmt(labels)} {counts[-1]}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics(METRICS)
+metrics.describe("bot_handler_seconds", "histogram", "Time spent in each update handler, by callback name")
+metrics.describe("bot_storage_load_seconds", "histogram", "Time to read a JSON store file")
+metrics.describe("bot_storage_load_bytes", "gauge", "Size of a JSON store file when last read")
+metrics.describe("bot_storage_save_seconds", "histogram", "Time to write and fsync a JSON store file")
+metrics.describe("bot_storage_save_bytes", "gauge", "Size of a JSON store file when last written")
+metrics.describe("bot_reminder_load_seconds", "histogram", "Time to load upcoming exams into the scheduler")
+metrics.describe("bot_reminder_tick_seconds", "histogram", "Duration of a scheduler pass that fired reminders")
+metrics.describe("bot_reminder_lag_seconds", "histogram", "Delivery time minus due time, by reminder offset in seconds")
+metrics.describe("bot_reminders_scheduled", "gauge", "Entries in the reminder heap")
+metrics.describe("bot_send_queue_depth", "gauge", "Messages waiting in the outbound queue")
+metrics.describe("bot_messages_sent_total", "counter", "Messages delivered by the send queue")
+metrics.describe("bot_send_errors_total", "counter", "Failed send attempts, by exception type")
+
+def serve_metrics(port):
+    """Serve /metrics from a background thread, for processes without a web server."""
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
 
 # ---------------- Utility functions ----------------
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    start = time.perf_counter()
+    with open(path, "r") as f:
+        data = json.load(f)
+        size = f.tell()
+    metrics.observe("bot_storage_load_seconds", time.perf_counter() - start, file=path)
+    metrics.set("bot_storage_load_bytes", size, file=path)
+    return data
+
 def load_exams():
-    if os.path.exists(EXAMS_FILE):
-        with open(EXAMS_FILE, "r") as f:
-            return json.load(f)
-    return []
+    return read_json(EXAMS_FILE, [])
+
+def write_json(path, data):
+    # Write to a temp file and rename so a crash never leaves a torn file
+    start = time.perf_counter()
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+        size = f.tell()
+    os.replace(tmp, path)
+    metrics.observe("bot_storage_save_seconds", time.perf_counter() - start, file=path)
+    metrics.set("bot_storage_save_bytes", size, file=path)
 
 def save_exams(exams):
-    with open(EXAMS_FILE, "w") as f:
-        json.dump(exams, f, indent=4)
+    write_json(EXAMS_FILE, exams)
+
+def load_next_exam_id(path=None):
+    return read_json(path or EXAM_IDS_FILE, {}).get("next_id", 1)
+
+def save_next_exam_id(next_id):
+    write_json(EXAM_IDS_FILE, {"next_id": next_id})
+
+def assign_exam_ids(entries, next_id=1):
+    """Number exams.json entries that have no ID (from before exam IDs) or a duplicate one.
+
+    Fresh IDs start at next_id (the saved high-water mark) or after the
+    highest existing ID, whichever is larger. Returns (next free ID,
+    whether any entry changed).
+    """
+    next_id = max(next_id, max((d["id"] for d in entries if isinstance(d.get("id"), int)), default=0) + 1)
+    seen = set()
+    migrated = False
+    for data in entries:
+        if not isinstance(data.get("id"), int) or data["id"] in seen:
+            data["id"] = next_id
+            next_id += 1
+            migrated = True
+        seen.add(data["id"])
+    return next_id, migrated
+
+def file_signature(path):
+    """(path, mtime_ns, size) of a file, or (path, 0, 0) if it does not exist."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return (path, 0, 0)
+    return (path, st.st_mtime_ns, st.st_size)
+
+def load_courses():
+    return read_json(COURSES_FILE, {"courses": [], "subscriptions": {}})
+
+def normalize_course(code):
+    return " ".join(code.upper().split())
+
+def course_tag(code):
+    """Short fixed-size stand-in for a course code in callback data, which Telegram caps at 64 bytes."""
+    return f"{zlib.crc32(code.encode()):08x}"
+
+
+# ---------------- Exam model ----------------
+class Exam:
+    """One exam of one chat, or of a catalog course when `course` is set.
+
+    `sent` packs the reminder offsets already delivered into a bitmask
+    (bit i is REMINDER_OFFSETS[i]). `id` is a stable number the store
+    assigns to a chat's own exams; buttons refer to exams by it.
+    to_dict/from_dict convert to and from the exams.json schema.
+    """
+
+    __slots__ = ("id", "chat_id", "time", "message", "sent", "course")
+
+    def __init__(self, chat_id, time, message, sent=0, course=None, exam_id=None):
+        self.id = exam_id
+        self.chat_id = chat_id
+        self.time = time
+        self.message = message
+        self.sent = sent
+        self.course = course
+
+    # "312 (Online)" -> subject "312", mode "Online". Parsed on access: only
+    # reminders need them, and loading every exam at startup should not.
+    @property
+    def subject(self):
+        message = self.message
+        return message.split('(')[0].strip() if '(' in message else message
+
+    @property
+    def mode(self):
+        message = self.message
+        return message.split('(')[-1].rstrip(')') if '(' in message and message.endswith(')') else ''
+
+    @property
+    def key(self):
+        return (self.course or self.chat_id, self.time, self.message)
+
+    def is_sent(self, index):
+        return bool(self.sent & (1 << index))
+
+    def mark_sent(self, index):
+        self.sent |= 1 << index
+
+    @classmethod
+    def from_dict(cls, data):
+        sent = 0
+        for i, flag in enumerate(data.get("sent", [])):
+            if flag:
+                sent |= 1 << i
+        return cls(data.get("chat_id"), datetime.datetime.fromisoformat(data["time"]), data["message"], sent, data.get("course"), data.get("id"))
+
+    def to_dict(self):
+        if self.course:
+            data = {"course": self.course, "time": self.time.isoformat(), "message": self.message}
+        else:
+            data = {"id": self.id, "chat_id": self.chat_id, "time": self.time.isoformat(), "message": self.message}
+        if self.sent:
+            data["sent"] = [self.is_sent(i) for i in range(len(REMINDER_OFFSETS))]
+        return data
+
+
+# ---------------- Exam storage ----------------
+# Handlers and the scheduler go through `store`, which is picked by EXAM_STORE:
+# "json" (default) keeps everything in exams.json, "sqlite" uses EXAMS_DB.
+# Course catalog exams and subscriptions live in COURSES_FILE or the same DB.
+EXAM_STORE = os.getenv("EXAM_STORE", "json")
+EXAMS_DB = os.getenv("EXAMS_DB", "exams.db")
+COURSES_FILE = "courses.json"
+
+# Dirty JSON data is flushed after FLUSH_DELAY seconds or FLUSH_BATCH changes
+FLUSH_DELAY = float(os.getenv("FLUSH_DELAY", "2"))
+FLUSH_BATCH = int(os.getenv("FLUSH_BATCH", "100"))
+
+class JsonExamStore:
+    """exams.json and courses.json held in memory, indexed by exam ID, chat_id and course.
+
+    The files are parsed on first use, in a worker thread, so importing the
+    module and answering updates that never read exams stay fast; the bot
+    starts the read early with preload(). Afterwards reads never touch the
+    disk. Mutations run under an asyncio lock and mark the store dirty;
+    files are rewritten atomically once FLUSH_DELAY passes or FLUSH_BATCH
+    changes pile up, so bursts of writes share one dump.
+    """
+
+    def __init__(self):
+        self.by_id = {}            # exam ID -> Exam
+        self.by_chat = {}          # chat_id -> {exam ID: Exam}, in insertion order
+        self.next_id = 1
+        self.courses = {}          # course code -> [Exam]
+        self.subscribers = {}      # course code -> {chat_id}
+        self.subscriptions = {}    # chat_id -> {course code}
+        self.loading = None
+        self.lock = asyncio.Lock()
+        self.dirty = 0
+        self.exams_dirty = self.courses_dirty = False
+        self.batch_full = asyncio.Event()
+        self.flush_task = None
+
+    def _read(self):
+        # Build the indexes off to the side and publish them at the end: this
+        # runs in a worker thread while the event loop keeps serving updates
+        by_id, by_chat = {}, {}
+        entries = load_exams()
+        next_id, migrated = assign_exam_ids(entries, load_next_exam_id())
+        for data in entries:
+            exam = Exam.from_dict(data)
+            by_id[exam.id] = exam
+            by_chat.setdefault(exam.chat_id, {})[exam.id] = exam
+        if migrated:
+            # Persist right away: buttons sent from now on carry these IDs
+            save_next_exam_id(next_id)
+            save_exams(entries)
+        catalog = load_courses()
+        courses = {}
+        for data in catalog["courses"]:
+            exam = Exam.from_dict(data)
+            courses.setdefault(exam.course, []).append(exam)
+        subscribers = {code: set(chats) for code, chats in catalog["subscriptions"].items()}
+        subscriptions = {}
+        for code, chats in subscribers.items():
+            for chat_id in chats:
+                subscriptions.setdefault(chat_id, set()).add(code)
+        self.by_id, self.by_chat, self.next_id = by_id, by_chat, next_id
+        self.courses, self.subscribers, self.subscriptions = courses, subscribers, subscriptions
+
+    def preload(self):
+        """Start reading the files in the background, if nothing has yet."""
+        if self.loading is None:
+            self.loading = asyncio.ensure_future(asyncio.to_thread(self._read))
+        return self.loading
+
+    async def ready(self):
+        if self.loading is None or not self.loading.done():
+            await asyncio.shield(self.preload())
+        else:
+            self.loading.result()
+
+    def signature(self):
+        """Size and mtime of the backing files, to tell whether a snapshot of them is stale."""
+        return tuple(file_signature(path) for path in (EXAMS_FILE, COURSES_FILE))
+
+    async def all(self):
+        await self.ready()
+        return [e for exams in self.by_chat.values() for e in exams.values()]
+
+    async def for_chat(self, chat_id):
+        await self.ready()
+        return list(self.by_chat.get(chat_id, {}).values())
+
+    async def get(self, exam_id):
+        await self.ready()
+        return self.by_id.get(exam_id)
+
+    async def upcoming(self, since):
+        exams = itertools.chain(await self.all(), *self.courses.values())
+        return sorted((e for e in exams if e.time >= since), key=lambda e: e.time)
+
+    async def upcoming_courses(self, since):
+        await self.ready()
+        exams = itertools.chain(*self.courses.values())
+        return sorted((e for e in exams if e.time >= since), key=lambda e: e.time)
+
+    async def add(self, exam):
+        await self.add_many([exam])
+
+    async def add_many(self, new_exams):
+        await self.ready()
+        async with self.lock:
+            for exam in new_exams:
+                exam.id = self.next_id
+                self.next_id += 1
+                self.by_id[exam.id] = exam
+                self.by_chat.setdefault(exam.chat_id, {})[exam.id] = exam
+                views.invalidate(exam.chat_id)
+            self._changed(len(new_exams))
+
+    async def remove(self, chat_id, exam_id):
+        """Delete one of the chat's exams by ID; returns it, or None if there is none."""
+        await self.ready()
+        async with self.lock:
+            exam = self.by_id.get(exam_id)
+            if exam is None or exam.chat_id != chat_id:
+                return None
+            del self.by_id[exam_id]
+            exams = self.by_chat[chat_id]
+            del exams[exam_id]
+            if not exams:
+                del self.by_chat[chat_id]
+            views.invalidate(chat_id)
+            self._changed()
+            return exam
+
+    async def mark_sent(self, updated):
+        await self.ready()
+        async with self.lock:
+            for u in updated:
+                if u.course:
+                    for e in self.courses.get(u.course, []):
+                        if e.key == u.key:
+                            e.sent = u.sent
+                else:
+                    e = self.by_id.get(u.id)
+                    if e is not None:
+                        e.sent = u.sent
+                self._changed(courses=bool(u.course))
+
+    async def course_exams(self, code):
+        await self.ready()
+        return list(self.courses.get(code, []))
+
+    async def add_course_exams(self, new_exams):
+        """Publish catalog exams, skipping slots that already exist; returns the new ones."""
+        await self.ready()
+        added = []
+        async with self.lock:
+            for exam in new_exams:
+                exams = self.courses.setdefault(exam.course, [])
+                if all(e.key != exam.key for e in exams):
+                    exams.append(exam)
+                    added.append(exam)
+                    for chat_id in self.subscribers.get(exam.course, ()):
+                        views.invalidate(chat_id)
+            self._changed(len(added), courses=True)
+        return added
+
+    async def remove_course_exams(self, code, keys):
+        """Withdraw published exams of a course by key; returns the removed ones."""
+        await self.ready()
+        async with self.lock:
+            exams = self.courses.get(code, [])
+            removed = [e for e in exams if e.key in keys]
+            if removed:
+                kept = [e for e in exams if e.key not in keys]
+                if kept:
+                    self.courses[code] = kept
+                else:
+                    del self.courses[code]
+                for chat_id in self.subscribers.get(code, ()):
+                    views.invalidate(chat_id)
+                self._changed(len(removed), courses=True)
+            return removed
+
+    async def subscribe(self, chat_id, code):
+        await self.ready()
+        async with self.lock:
+            self.subscribers.setdefault(code, set()).add(chat_id)
+            self.subscriptions.setdefault(chat_id, set()).add(code)
+            views.invalidate(chat_id)
+            self._changed(courses=True)
+
+    async def unsubscribe(self, chat_id, code):
+        await self.ready()
+        async with self.lock:
+            if chat_id not in self.subscribers.get(code, ()):
+                return False
+            self.subscribers[code].discard(chat_id)
+            self.subscriptions[chat_id].discard(code)
+            views.invalidate(chat_id)
+            self._changed(courses=True)
+            return True
+
+    async def subscribers_of(self, code):
+        await self.ready()
+        return list(self.subscribers.get(code, ()))
+
+    async def subscribed(self, chat_id):
+        await self.ready()
+        return [e for code in sorted(self.subscriptions.get(chat_id, ())) for e in self.courses.get(code, [])]
+
+    def _changed(self, count=1, courses=False):
+        if courses:
+            self.courses_dirty = True
+        else:
+            self.exams_dirty = True
+        self.dirty += count
+        if self.dirty >= FLUSH_BATCH:
+            self.batch_full.set()
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.wait_for(self.batch_full.wait(), FLUSH_DELAY)
+        except asyncio.TimeoutError:
+            pass
+        await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            if self.exams_dirty:
+                # High-water mark first: after a crash it may run ahead of exams.json, never behind
+                await asyncio.to_thread(save_next_exam_id, self.next_id)
+                await asyncio.to_thread(save_exams, [e.to_dict() for e in await self.all()])
+            if self.courses_dirty:
+                catalog = {
+                    "courses": [e.to_dict() for exams in self.courses.values() for e in exams],
+                    "subscriptions": {code: sorted(chats) for code, chats in self.subscribers.items() if chats},
+                }
+                await asyncio.to_thread(write_json, COURSES_FILE, catalog)
+            self.dirty = 0
+            self.exams_dirty = self.courses_dirty = False
+            self.batch_full.clear()
+
+    async def close(self):
+        # Wake a pending debounced flush instead of cancelling it mid-write
+        self.batch_full.set()
+        if self.flush_task:
+            await self.flush_task
+        await self.flush()
+
+class SqliteExamStore:
+    """SQLite storage in WAL mode, indexed by chat_id, course and exam time."""
+
+    def __init__(self, path):
+        import sqlite3
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS exams (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                time TEXT NOT NULL,
+                message TEXT NOT NULL,
+                sent INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_exams_chat ON exams(chat_id);
+            CREATE INDEX IF NOT EXISTS idx_exams_time ON exams(time);
+            CREATE TABLE IF NOT EXISTS courses (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                code TEXT NOT NULL,
+                time TEXT NOT NULL,
+                message TEXT NOT NULL,
+                sent INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (code, time, message)
+            );
+            CREATE INDEX IF NOT EXISTS idx_courses_time ON courses(time);
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                chat_id INTEGER NOT NULL,
+                code TEXT NOT NULL,
+                PRIMARY KEY (chat_id, code)
+            );
+            CREATE INDEX IF NOT EXISTS idx_subscriptions_code ON subscriptions(code);
+            """
+        )
+        self.db.commit()
+
+    @staticmethod
+    def _row(row):
+        exam_id, chat_id, time, message, sent = row
+        return Exam(chat_id, datetime.datetime.fromisoformat(time), message, sent, exam_id=exam_id)
+
+    @staticmethod
+    def _course_row(row):
+        code, time, message, sent = row
+        return Exam(None, datetime.datetime.fromisoformat(time), message, sent, code)
+
+    def _query(self, sql, params=()):
+        return [self._row(r) for r in self.db.execute(sql, params)]
+
+    def _course_query(self, sql, params=()):
+        return [self._course_row(r) for r in self.db.execute(sql, params)]
+
+    async def all(self):
+        return self._query("SELECT id, chat_id, time, message, sent FROM exams ORDER BY id")
+
+    async def for_chat(self, chat_id):
+        return self._query("SELECT id, chat_id, time, message, sent FROM exams WHERE chat_id = ? ORDER BY id", (chat_id,))
+
+    async def get(self, exam_id):
+        rows = self._query("SELECT id, chat_id, time, message, sent FROM exams WHERE id = ?", (exam_id,))
+        return rows[0] if rows else None
+
+    async def upcoming(self, since):
+        # ISO timestamps sort lexicographically, so the time index answers this
+        since = since.isoformat()
+        return list(heapq.merge(
+            self._query("SELECT id, chat_id, time, message, sent FROM exams WHERE time >= ? ORDER BY time", (since,)),
+            self._course_query("SELECT code, time, message, sent FROM courses WHERE time >= ? ORDER BY time", (since,)),
+            key=lambda e: e.time
+        ))
+
+    async def upcoming_courses(self, since):
+        return self._course_query("SELECT code, time, message, sent FROM courses WHERE time >= ? ORDER BY time", (since.isoformat(),))
+
+    async def add(self, exam):
+        await self.add_many([exam])
+
+    async def add_many(self, new_exams):
+        with self.db:
+            for e in new_exams:
+                # A given id is kept (migrations); None lets SQLite pick the next one
+                cursor = self.db.execute(
+                    "INSERT INTO exams (id, chat_id, time, message, sent) VALUES (?, ?, ?, ?, ?)",
+                    (e.id, e.chat_id, e.time.isoformat(), e.message, e.sent)
+                )
+                e.id = cursor.lastrowid
+        for exam in new_exams:
+            views.invalidate(exam.chat_id)
+
+    async def remove(self, chat_id, exam_id):
+        """Delete one of the chat's exams by ID; returns it, or None if there is none."""
+        with self.db:
+            rows = self._query("SELECT id, chat_id, time, message, sent FROM exams WHERE id = ? AND chat_id = ?", (exam_id, chat_id))
+            if not rows:
+                return None
+            self.db.execute("DELETE FROM exams WHERE id = ?", (exam_id,))
+        views.invalidate(chat_id)
+        return rows[0]
+
+    async def mark_sent(self, updated):
+        with self.db:
+            self.db.executemany(
+                "UPDATE exams SET sent = ? WHERE id = ?",
+                [(e.sent, e.id) for e in updated if not e.course]
+            )
+            self.db.executemany(
+                "UPDATE courses SET sent = ? WHERE code = ? AND time = ? AND message = ?",
+                [(e.sent, e.course, e.time.isoformat(), e.message) for e in updated if e.course]
+            )
+
+    async def course_exams(self, code):
+        return self._course_query("SELECT code, time, message, sent FROM courses WHERE code = ? ORDER BY time", (code,))
+
+    async def add_course_exams(self, new_exams):
+        """Publish catalog exams, skipping slots that already exist; returns the new ones."""
+        added = []
+        with self.db:
+            for e in new_exams:
+                cursor = self.db.execute(
+                    "INSERT OR IGNORE INTO courses (code, time, message, sent) VALUES (?, ?, ?, ?)",
+                    (e.course, e.time.isoformat(), e.message, e.sent)
+                )
+                if cursor.rowcount:
+                    added.append(e)
+        for code in {e.course for e in added}:
+            for chat_id in await self.subscribers_of(code):
+                views.invalidate(chat_id)
+        return added
+
+    async def remove_course_exams(self, code, keys):
+        """Withdraw published exams of a course by key; returns the removed ones."""
+        removed = [e for e in await self.course_exams(code) if e.key in keys]
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM courses WHERE code = ? AND time = ? AND message = ?",
+                [(code, e.time.isoformat(), e.message) for e in removed]
+            )
+        for chat_id in await self.subscribers_of(code):
+            views.invalidate(chat_id)
+        return removed
+
+    async def subscribe(self, chat_id, code):
+        with self.db:
+            self.db.execute("INSERT OR IGNORE INTO subscriptions (chat_id, code) VALUES (?, ?)", (chat_id, code))
+        views.invalidate(chat_id)
+
+    async def unsubscribe(self, chat_id, code):
+        with self.db:
+            cursor = self.db.execute("DELETE FROM subscriptions WHERE chat_id = ? AND code = ?", (chat_id, code))
+        views.invalidate(chat_id)
+        return cursor.rowcount > 0
+
+    async def subscribers_of(self, code):
+        return [chat_id for (chat_id,) in self.db.execute("SELECT chat_id FROM subscriptions WHERE code = ?", (code,))]
+
+    async def subscribed(self, chat_id):
+        return self._course_query(
+            "SELECT c.code, c.time, c.message, c.sent FROM subscriptions s JOIN courses c ON c.code = s.code "
+            "WHERE s.chat_id = ? ORDER BY c.code, c.time",
+            (chat_id,)
+        )
+
+    def preload(self):
+        pass
+
+    async def ready(self):
+        pass
+
+    def signature(self):
+        """The database file, plus whether the WAL holds writes not yet checkpointed into it."""
+        wal = file_signature(self.path + "-wal")[2]
+        return (file_signature(self.path), wal)
+
+    async def close(self):
+        self.db.close()
+
+def open_store():
+    if EXAM_STORE == "sqlite":
+        return SqliteExamStore(EXAMS_DB)
+    return JsonExamStore()
+
+def migrate_json_to_sqlite(json_path=EXAMS_FILE, db_path=EXAMS_DB, courses_path=COURSES_FILE, ids_path=EXAM_IDS_FILE):
+    """One-shot copy of exams.json and courses.json (including sent flags and exam IDs) into a SQLite store."""
+    with open(json_path, "r") as f:
+        entries = json.load(f)
+    # Same numbering the JSON store applies, so IDs are unique before they hit the primary key
+    next_id, _ = assign_exam_ids(entries, load_next_exam_id(ids_path))
+    exams = [Exam.from_dict(data) for data in entries]
+    catalog = {"courses": [], "subscriptions": {}}
+    if os.path.exists(courses_path):
+        with open(courses_path, "r") as f:
+            catalog = json.load(f)
+    async def copy():
+        db = SqliteExamStore(db_path)
+        try:
+            if db.db.execute("SELECT 1 FROM exams UNION ALL SELECT 1 FROM courses LIMIT 1").fetchone():
+                # A second run would insert every exam again
+                raise SystemExit(f"{db_path} already holds exams; not migrating into it again")
+            await db.add_many(exams)
+            with db.db:
+                # AUTOINCREMENT continues after the JSON store's high-water
+                # mark, so IDs of exams deleted before the move stay unused
+                if not db.db.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'exams'", (next_id - 1,)).rowcount:
+                    db.db.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('exams', ?)", (next_id - 1,))
+            await db.add_course_exams([Exam.from_dict(data) for data in catalog["courses"]])
+            for code, chats in catalog["subscriptions"].items():
+                for chat_id in chats:
+                    await db.subscribe(chat_id, code)
+        finally:
+            await db.close()
+    asyncio.run(copy())
+    return len(exams)
+
+store = open_store()
 
 
 # Reliable reminder system: reminders are checked and sent in a background loop
@@ -123,65 +855,1119 @@ def get_reminder_texts(message, reminder_time):
     ]
     return texts
 
+def reminder_details(exam):
+    # Extract details for UI
+    exam_time_str = exam.time.strftime('%A, %d %B %Y at %I:%M %p')
+    subject, mode = exam.subject, exam.mode
+    # Inline button for details (opens external link)
+    # Build URL with query params
+    base_url = "https://sts.ug.edu.gh/timetable/"
+    params = {
+        "subject": subject,
+        "datetime": exam_time_str,
+        "mode": mode
+    }
+    url = base_url + "?" + urllib.parse.urlencode(params)
+    # Friendly Markdown body
+    body = (
+        f"*Subject:* {subject}\n"
+        f"*Date & Time:* `{exam_time_str}`\n"
+        f"*Mode:* {mode if mode else 'N/A'}\n"
+    )
+    return subject, body, url
+
+def build_reminder(exam, index):
+    txt = get_reminder_texts(exam.message, exam.time)[index]
+    _, body, url = reminder_details(exam)
+    notif = f"{txt}\n\n{body}"
+    keyboard = InlineKeyboardMarkup([
+        [InlineKeyboardButton("View Exam Details", url=url)]
+    ])
+    return notif, keyboard
+
+# Telegram rejects messages over 4096 characters, so a digest holds at most
+# this many reminders and characters; the rest go out in further digests
+DIGEST_MAX_ITEMS = 20
+DIGEST_MAX_CHARS = 3500
+
+def digest_entry(exam, index):
+    subject, body, url = reminder_details(exam)
+    text = f"{get_reminder_texts(exam.message, exam.time)[index]}\n{body}\n"
+    return text, InlineKeyboardButton(f"View {subject}", url=url)
+
+def build_digest(reminders):
+    """One message for several (exam, offset index) reminders of the same chat."""
+    notif = f"🔔 *You have {len(reminders)} exam reminders:*\n\n"
+    buttons = []
+    for exam, index in reminders:
+        text, button = digest_entry(exam, index)
+        notif += text
+        buttons.append([button])
+    return notif, InlineKeyboardMarkup(buttons)
+
+def split_digest(items, reminder):
+    """Split items into runs that each fit in one digest; reminder(item) gives its (exam, offset index)."""
+    chunk, size = [], 0
+    for item in items:
+        length = len(digest_entry(*reminder(item))[0])
+        if chunk and (len(chunk) >= DIGEST_MAX_ITEMS or size + length > DIGEST_MAX_CHARS):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(item)
+        size += length
+    if chunk:
+        yield chunk
+
+# ---------------- Outbound delivery ----------------
+# Telegram allows ~30 messages/s per bot and ~1 message/s per chat
+SEND_RATE = float(os.getenv("SEND_RATE", "30"))
+CHAT_SEND_RATE = float(os.getenv("CHAT_SEND_RATE", "1"))
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "8"))
+SEND_ATTEMPTS = 5
+SEND_STATS_INTERVAL = 60
+
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self):
+        """Seconds until a token is available, without taking it."""
+        self._refill()
+        return max(0, (1 - self.tokens) / self.rate)
+
+    def reserve(self):
+        """Take a token and return how long the caller must wait before using it."""
+        self._refill()
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self):
+        self._refill()
+        return self.tokens >= self.capacity
+
+class SendQueue:
+    """Priority queue of outgoing messages drained by a pool of workers.
+
+    Every send passes a global and a per-chat token bucket. RetryAfter pauses
+    all workers for the period Telegram asks for; other transient errors are
+    retried with exponential backoff up to SEND_ATTEMPTS. Lower priority
+    values are sent first.
+    """
+
+    def __init__(self):
+        self.queue = asyncio.PriorityQueue()
+        self.seq = itertools.count()
+        self.bucket = TokenBucket(SEND_RATE, capacity=SEND_RATE)
+        self.chat_buckets = {}
+        self.resume_at = 0
+        self.tasks = []
+        self.sent = self.failed = self.retried = 0
+        self.throughput = 0.0
+
+    def start(self, bot):
+        self.bot = bot
+        metrics.set("bot_send_queue_depth", self.queue.qsize)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(SEND_WORKERS)]
+        self.tasks.append(asyncio.create_task(self._report()))
+
+    async def stop(self):
+        # Cancel until every task is gone: the HTTP client can swallow a
+        # cancellation that lands just as a send completes, and that worker
+        # would otherwise go back to waiting on the queue forever
+        while self.tasks:
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.wait(self.tasks, timeout=1)
+            self.tasks = [task for task in self.tasks if not task.done()]
+
+    def put(self, priority, chat_id, on_done=None, on_start=None, **kwargs):
+        """Queue a send_message call.
+
+        on_start() is called right before each API request and on_done(ok)
+        is awaited once the send settles. If on_start() returns False the
+        message is dropped unsent and settles as not ok.
+        """
+        self.queue.put_nowait((priority, next(self.seq), chat_id, kwargs, on_start, on_done, 0))
+
+    def stats(self):
+        return {
+            "depth": self.queue.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "throughput": self.throughput,
+        }
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self.chat_buckets = {c: b for c, b in self.chat_buckets.items() if not b.idle()}
+            bucket = self.chat_buckets[chat_id] = TokenBucket(CHAT_SEND_RATE)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            item = await self.queue.get()
+            priority, seq, chat_id, kwargs, on_start, on_done, attempts = item
+            chat_bucket = self._chat_bucket(chat_id)
+            wait = chat_bucket.delay()
+            if wait:
+                # Park it instead of blocking a worker on one busy chat
+                asyncio.get_running_loop().call_later(wait, self.queue.put_nowait, item)
+                self.queue.task_done()
+                continue
+            chat_bucket.reserve()
+            dropped = False
+            try:
+                await asyncio.sleep(max(0, self.resume_at - time.monotonic()))
+                await asyncio.sleep(self.bucket.reserve())
+                if on_start:
+                    dropped = on_start() is False
+                if not dropped:
+                    await self.bot.send_message(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                metrics.inc("bot_send_errors_total", type="RetryAfter")
+                retry_after = e.retry_after
+                if isinstance(retry_after, datetime.timedelta):
+                    retry_after = retry_after.total_seconds()
+                logging.warning(f"Flood control: pausing sends for {retry_after}s")
+                self.resume_at = max(self.resume_at, time.monotonic() + retry_after)
+                self.retried += 1
+                self.queue.put_nowait((priority, seq, chat_id, kwargs, on_start, on_done, attempts))
+                continue
+            except (Forbidden, BadRequest) as e:
+                metrics.inc("bot_send_errors_total", type=type(e).__name__)
+                logging.error(f"Failed to send to chat {chat_id}: {e}")
+                ok = False
+            except Exception as e:
+                metrics.inc("bot_send_errors_total", type=type(e).__name__)
+                if attempts + 1 < SEND_ATTEMPTS:
+                    logging.warning(f"Send to chat {chat_id} failed ({e}), retrying")
+                    self.retried += 1
+                    asyncio.get_running_loop().call_later(
+                        2 ** attempts, self.queue.put_nowait,
+                        (priority, seq, chat_id, kwargs, on_start, on_done, attempts + 1)
+                    )
+                    continue
+                logging.error(f"Failed to send to chat {chat_id}: {e}")
+                ok = False
+            else:
+                ok = not dropped
+            finally:
+                self.queue.task_done()
+            if ok:
+                self.sent += 1
+                metrics.inc("bot_messages_sent_total")
+            elif not dropped:
+                self.failed += 1
+            if on_done:
+                try:
+                    await on_done(ok)
+                except Exception as e:
+                    logging.error(f"Send callback failed: {e}")
+
+    async def _report(self):
+        last = self.sent
+        while True:
+            await asyncio.sleep(SEND_STATS_INTERVAL)
+            self.throughput = (self.sent - last) / SEND_STATS_INTERVAL
+            last = self.sent
+            if self.throughput or self.queue.qsize():
+                logging.info(f"Send queue: depth={self.queue.qsize()} sent={self.sent} failed={self.failed} retried={self.retried} rate={self.throughput:.1f} msg/s")
+
+send_queue = SendQueue()
+
+# Reminders for one chat falling due within this many seconds share a message
+DIGEST_WINDOW = datetime.timedelta(seconds=float(os.getenv("DIGEST_WINDOW", "60")))
+# A reminder is still worth sending until an hour after the exam started
+REMINDER_GRACE = datetime.timedelta(hours=1)
+# Failed sends are retried after this delay, doubling on every further failure
+REMINDER_RETRY = datetime.timedelta(seconds=10)
+# Rounds of SendQueue retries a reminder gets before it is recorded as failed
+REMINDER_ATTEMPTS = int(os.getenv("REMINDER_ATTEMPTS", "3"))
+# Upper bound on a single sleep so wall-clock jumps (host suspend) are noticed
+MAX_SLEEP = 300
+# On startup, exams this far back are checked for reminders missed while down
+CATCHUP_LOOKBACK = datetime.timedelta(days=float(os.getenv("CATCHUP_LOOKBACK_DAYS", "7")))
+# Messages per second for draining missed reminders, leaving room for live traffic
+CATCHUP_RATE = float(os.getenv("CATCHUP_RATE", str(SEND_RATE / 2)))
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", "outbox")
+# Stale lines tolerated in a ledger file before it is compacted
+OUTBOX_SLACK = 10000
+# Exams scheduled between yields to the event loop while the index is built
+LOAD_CHUNK = 5000
+# Optional marshal file of the scheduler's exams, written at a clean shutdown
+# and loaded instead of the store on the next start if the store is unchanged
+SCHEDULE_SNAPSHOT = os.getenv("SCHEDULE_SNAPSHOT")
+
+class Outbox:
+    """Append-only ledger of reminder deliveries, one JSON-lines file per shard.
+
+    Each reminder, keyed by (exam key, last offset, chat), moves
+    pending -> inflight -> delivered/failed. Every step appends one line, so
+    a batch of deliveries costs an append and one fsync instead of a rewrite
+    of the exam store. On replay the newest line per reminder wins.
+    """
+
+    SETTLED = ("delivered", "failed")
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}       # shard -> open log file
+        self.entries = {}     # shard -> {(exam key, last offset, chat): newest entry}
+        self.lines = {}       # shard -> lines in the log file
+        self.unsynced = set()
+
+    def _log(self, shard):
+        return os.path.join(self.path, f"shard-{shard}.log")
+
+    def load(self, shard):
+        """Read the shard's log into memory and return its newest entries."""
+        entries, lines = {}, 0
+        try:
+            with open(self._log(shard), encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    owner, when, message = entry["key"]
+                    key = (owner, datetime.datetime.fromisoformat(when), message)
+                    entries[key, entry["last"], entry["chat"]] = entry
+        except FileNotFoundError:
+            pass
+        self.entries[shard], self.lines[shard] = entries, lines
+        return entries
+
+    def record(self, shard, key, first, last, chat_id, state, attempts):
+        entry = {
+            "key": [key[0], key[1].isoformat(), key[2]],
+            "first": first,
+            "last": last,
+            "chat": chat_id,
+            "state": state,
+            "attempts": attempts,
+            "ts": round(time.time(), 3),
+        }
+        self.entries.setdefault(shard, {})[key, last, chat_id] = entry
+        f = self.files.get(shard)
+        if f is None:
+            os.makedirs(self.path, exist_ok=True)
+            f = self.files[shard] = open(self._log(shard), "a", encoding="utf-8")
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        self.lines[shard] = self.lines.get(shard, 0) + 1
+        self.unsynced.add(shard)
+
+    def sync(self):
+        """fsync every log written since the last call, compacting overgrown ones."""
+        for shard in list(self.unsynced):
+            os.fsync(self.files[shard].fileno())
+            if self.lines[shard] > 2 * len(self.entries[shard]) + OUTBOX_SLACK:
+                self.compact(shard)
+        self.unsynced.clear()
+
+    def compact(self, shard):
+        """Rewrite the shard's log with the newest entry of each reminder still in its grace period."""
+        cutoff = datetime.datetime.now() - REMINDER_GRACE
+        entries = {ident: entry for ident, entry in self.entries.get(shard, {}).items() if ident[0][1] > cutoff}
+        f = self.files.pop(shard, None)
+        if f:
+            f.close()
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._log(shard) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in entries.values():
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._log(shard))
+        self.entries[shard], self.lines[shard] = entries, len(entries)
+        self.unsynced.discard(shard)
+
+    def release(self, shard):
+        """Sync and close the shard's log so another worker can take it over."""
+        f = self.files.pop(shard, None)
+        if f:
+            os.fsync(f.fileno())
+            f.close()
+        self.entries.pop(shard, None)
+        self.lines.pop(shard, None)
+        self.unsynced.discard(shard)
+
+    def close(self):
+        for shard in list(self.files):
+            self.release(shard)
+
+class ReminderScheduler:
+    """Keeps the next pending reminder of every exam in a heap ordered by fire time.
+
+    Instead of rescanning exams.json on a timer, the loop sleeps until the
+    earliest entry is due. Handlers call add()/remove() when exams change.
+    Every send is recorded in the Outbox ledger, which is replayed when a
+    shard is loaded so a restart neither repeats nor drops reminders.
+    """
+
+    def __init__(self):
+        self.heap = []        # (fire_time, seq, exam key, offset index, exam)
+        self.pending = {}     # exam key -> exam dict
+        self.seq = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.delivered = []   # exams whose sent flags are not persisted yet
+        self.shards = None    # shards this process owns; None means all
+        self.outbox = Outbox(OUTBOX_DIR)
+        self.attempts = {}    # (exam key, last offset, chat) -> send rounds so far
+        self.backlog = []     # missed (exam key, exam, first, last) awaiting catch_up()
+        self.collapsed = 0
+        self.expired = 0
+        self.ready = asyncio.Event()   # set once the first load is done
+        self.removed = set()  # keys removed before then, not to be loaded back
+        self.courses_seen = set()  # keys of owned course exams scheduled so far
+
+    async def load(self, exams):
+        """Schedule exams (sorted by time); missed reminders wait for catch_up().
+
+        Updates keep being handled while this runs: exams handlers add are
+        scheduled alongside, and ones they remove are not loaded back.
+        """
+        for shard in range(WORKERS):
+            await self.add_shard(shard, exams)
+        self.ready.set()
+        self.removed.clear()
+
+    def add(self, exam):
+        key = exam.key
+        if not self._owns(exam):
+            return
+        if exam.course:
+            self.courses_seen.add(key)
+        if key in self.pending:
+            return
+        self.pending[key] = exam
+        if not self._push_next(key, exam, 0):
+            del self.pending[key]
+        self.wakeup.set()
+
+    def remove(self, exam):
+        # Heap entries for removed exams are skipped lazily when they come due:
+        # each entry holds its exam, which is no longer the one pending
+        self.pending.pop(exam.key, None)
+        self.courses_seen.discard(exam.key)
+        if not self.ready.is_set():
+            self.removed.add(exam.key)
+
+    def sync_courses(self, exams):
+        """Schedule catalog exams published through other workers, drop withdrawn ones.
+
+        Course exams are sharded by course code but /addcourse is routed by
+        the publisher's chat, so the worker that stores a new exam is often
+        not the one that owns it. Exams already scheduled here are skipped:
+        the store's sent flags for them may lag behind this worker's.
+        """
+        live = set()
+        for exam in exams:
+            live.add(exam.key)
+            if exam.key not in self.courses_seen:
+                self.add(exam)
+        for key, exam in list(self.pending.items()):
+            if exam.course and key not in live:
+                self.remove(exam)
+
+    async def add_shard(self, shard, exams):
+        if self.shards is not None:
+            self.shards.add(shard)
+        if WORKERS > 1:
+            exams = [exam for exam in exams if shard_of(exam) == shard]
+        if self.removed:
+            exams = [exam for exam in exams if exam.key not in self.removed]
+        resend = self._replay(shard, exams)
+        now = datetime.datetime.now()
+        # Only exams up to the earliest offset ahead can have a reminder due
+        missable = bisect.bisect_right(exams, now + REMINDER_OFFSETS[0], key=lambda e: e.time)
+        for exam in exams[:missable]:
+            self._missed(exam, now)
+        for n, exam in enumerate(exams, 1):
+            if not self.removed or exam.key not in self.removed:
+                self.add(exam)
+            if n % LOAD_CHUNK == 0:
+                await asyncio.sleep(0)
+        for chat_id, items in resend.items():
+            self._send(chat_id, items)
+        self.outbox.sync()
+
+    def drop_shard(self, shard):
+        self.shards.discard(shard)
+        for key, exam in list(self.pending.items()):
+            if shard_of(exam) == shard:
+                del self.pending[key]
+        # Regaining the shard schedules the same exams again, so their
+        # entries can't be left to be skipped lazily
+        self.heap = [entry for entry in self.heap if shard_of(entry[4]) != shard]
+        heapq.heapify(self.heap)
+        self.outbox.release(shard)
+
+    def _missed(self, exam, now):
+        """Move an exam with overdue reminders to the backlog, or expire them."""
+        due = [
+            i for i, offset in enumerate(REMINDER_OFFSETS)
+            if not exam.is_sent(i) and exam.time - offset <= now
+        ]
+        if not due or exam.key in self.pending:
+            return
+        if now >= exam.time + REMINDER_GRACE:
+            self.expired += len(due)
+            for i in due:
+                exam.mark_sent(i)
+            self.delivered.append(exam)
+            return
+        # Only the latest overdue offset is still worth sending
+        self.collapsed += len(due) - 1
+        self.pending[exam.key] = exam
+        self.backlog.append((exam.key, exam, due[0], due[-1]))
+
+    async def catch_up(self):
+        """Drain the backlog left by load()/add_shard() and log a report.
+
+        One message per chat, paced at CATCHUP_RATE and queued behind fresh
+        reminders; returns once every one of them is delivered or failed.
+        """
+        backlog, self.backlog = self.backlog, []
+        collapsed, self.collapsed = self.collapsed, 0
+        expired, self.expired = self.expired, 0
+        started = time.monotonic()
+        by_chat = {}
+        for key, exam, first, last in backlog:
+            if self.pending.get(key) is not exam:
+                continue
+            if exam.course:
+                for chat_id in await store.subscribers_of(exam.course):
+                    by_chat.setdefault(chat_id, []).append((key, exam, first, last))
+                self._settle(key, exam, first, last)
+            else:
+                by_chat.setdefault(exam.chat_id, []).append((key, exam, first, last))
+        counts = {True: 0, False: 0}
+        remaining = sum(map(len, by_chat.values()))
+        done = asyncio.Event()
+        def settled(ok, n):
+            nonlocal remaining
+            counts[ok] += n
+            remaining -= n
+            if remaining <= 0:
+                done.set()
+        bucket = TokenBucket(CATCHUP_RATE)
+        for chat_id, items in by_chat.items():
+            await asyncio.sleep(bucket.reserve())
+            self._send(chat_id, items, priority=len(REMINDER_OFFSETS), on_settled=settled)
+            self.outbox.sync()
+        if remaining > 0:
+            await done.wait()
+        if backlog or expired:
+            logging.info(
+                f"Catch-up: {counts[True]} reminders sent, {counts[False]} failed, "
+                f"{collapsed} collapsed, {expired} expired in {time.monotonic() - started:.1f}s"
+            )
+
+    def _owns(self, exam):
+        return self.shards is None or shard_of(exam) in self.shards
+
+    def _replay(self, shard, exams):
+        """Apply the shard's ledger to freshly loaded exams.
+
+        Settled reminders get their sent flags back even if the store never
+        saw them. Unsettled ones of personal exams are left unsent, so the
+        heap fires them again; those of catalog exams were already fanned
+        out and are returned as {chat: items} to send directly.
+        """
+        by_key = {exam.key: exam for exam in exams}
+        entries = self.outbox.load(shard)
+        kept, resend = {}, {}
+        for ident, entry in entries.items():
+            key, last, chat_id = ident
+            exam = by_key.get(key)
+            if exam is None:
+                continue
+            kept[ident] = entry
+            settled = entry["state"] in Outbox.SETTLED
+            if (settled or exam.course) and not exam.is_sent(last):
+                for i in range(entry["first"], last + 1):
+                    exam.mark_sent(i)
+                self.delivered.append(exam)
+            if not settled:
+                self.attempts[ident] = entry["attempts"]
+                if exam.course:
+                    resend.setdefault(chat_id, []).append((key, exam, entry["first"], last))
+        if entries:
+            logging.info(f"Replayed {len(kept)} ledger entries for shard {shard}, {sum(map(len, resend.values()))} course reminders to resend")
+        self.outbox.entries[shard] = kept
+        self.outbox.compact(shard)
+        return resend
+
+    async def flush(self):
+        # Ledger first: a sent flag must never be on disk without its entry
+        self.outbox.sync()
+        if self.delivered:
+            # Persist the sent flags once per batch of deliveries
+            delivered, self.delivered = self.delivered, []
+            await store.mark_sent(delivered)
+
+    def _push_next(self, key, exam, start):
+        if datetime.datetime.now() >= exam.time + REMINDER_GRACE:
+            return False
+        for i in range(start, len(REMINDER_OFFSETS)):
+            if not exam.is_sent(i):
+                heapq.heappush(self.heap, (exam.time - REMINDER_OFFSETS[i], next(self.seq), key, i, exam))
+                return True
+        return False
+
+    async def run(self, app):
+        metrics.set("bot_reminders_scheduled", self.heap.__len__)
+        while True:
+            tick = time.perf_counter()
+            self.wakeup.clear()
+            await self.flush()
+            now = datetime.datetime.now()
+            due = []
+            while self.heap and self.heap[0][0] <= now:
+                due.append(heapq.heappop(self.heap))
+            if due and DIGEST_WINDOW:
+                # Pull forward entries of the same chats due within the digest window
+                chats = {entry[2][0] for entry in due}
+                later = []
+                while self.heap and self.heap[0][0] <= now + DIGEST_WINDOW:
+                    entry = heapq.heappop(self.heap)
+                    (due if entry[2][0] in chats else later).append(entry)
+                for entry in later:
+                    heapq.heappush(self.heap, entry)
+            if due:
+                await self._fire(app, due, now)
+                metrics.observe("bot_reminder_tick_seconds", time.perf_counter() - tick)
+                continue
+            timeout = MAX_SLEEP
+            if self.heap:
+                timeout = min(timeout, (self.heap[0][0] - now).total_seconds())
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire(self, app, due, now):
+        horizon = now + DIGEST_WINDOW
+        by_chat = {}
+        for _, _, key, i, exam in due:
+            # An exam removed and added back has the same key but a new
+            # entry of its own; this one belongs to the removed exam
+            if self.pending.get(key) is not exam or exam.is_sent(i):
+                continue
+            # Skip offsets made obsolete by a later one that is already due
+            last = i
+            for j in range(i + 1, len(REMINDER_OFFSETS)):
+                if exam.time - REMINDER_OFFSETS[j] <= horizon:
+                    last = j
+            if exam.course:
+                # Catalog exam: due once, fanned out to every subscriber.
+                # The ledger tracks each chat, so it counts as sent now.
+                subscribers = await store.subscribers_of(exam.course)
+                logging.info(f"Sending reminder {last} for course exam '{exam.message}' to {len(subscribers)} subscribers at {now.strftime('%Y-%m-%d %H:%M:%S')}")
+                for chat_id in subscribers:
+                    by_chat.setdefault(chat_id, []).append((key, exam, i, last))
+                self._settle(key, exam, i, last)
+                continue
+            logging.info(f"Sending reminder {last} for exam '{exam.message}' to chat {exam.chat_id} at {now.strftime('%Y-%m-%d %H:%M:%S')}")
+            by_chat.setdefault(exam.chat_id, []).append((key, exam, i, last))
+        rendered = {}
+        for chat_id, items in by_chat.items():
+            self._send(chat_id, items, rendered)
+        # Nothing is sent before the next await, so this lands first
+        self.outbox.sync()
+
+    def _send(self, chat_id, items, rendered=None, priority=0, on_settled=None):
+        """Record items as pending and queue them to chat_id, as few messages as fit.
+
+        on_settled(ok, count) hears about items once they stop being retried.
+        The caller syncs the outbox before yielding to the event loop.
+        """
+        for key, exam, first, last in items:
+            ident = key, last, chat_id
+            self.attempts[ident] = self.attempts.get(ident, 0) + 1
+            self.outbox.record(shard_of(exam), key, first, last, chat_id, "pending", self.attempts[ident])
+        if len(items) == 1:
+            # The common case; skip rendering it just to measure it
+            self._queue(chat_id, items, rendered, priority, on_settled)
+            return
+        for chunk in split_digest(items, lambda item: (item[1], item[3])):
+            self._queue(chat_id, chunk, rendered, priority, on_settled)
+
+    def _queue(self, chat_id, items, rendered, priority, on_settled):
+        if len(items) == 1:
+            key, exam, _, last = items[0]
+            if rendered is None:
+                rendered = {}
+            if (key, last) not in rendered:
+                rendered[key, last] = build_reminder(exam, last)
+            notif, keyboard = rendered[key, last]
+        else:
+            notif, keyboard = build_digest([(exam, last) for _, exam, _, last in items])
+        # "Exam time!" (the last offset) goes out before "in 3 days"
+        send_queue.put(
+            priority + min(len(REMINDER_OFFSETS) - 1 - last for _, _, _, last in items),
+            chat_id,
+            on_start=functools.partial(self._in_flight, chat_id, items),
+            on_done=functools.partial(self._delivered, chat_id, items, priority, on_settled),
+            text=notif,
+            parse_mode="Markdown",
+            reply_markup=keyboard
+        )
+
+    def _in_flight(self, chat_id, items):
+        if not all(self._owns(exam) for _, exam, _, _ in items):
+            # A shard was handed over while this waited in the queue, and its
+            # new owner sends the reminders again from the ledger. _delivered()
+            # retries the items still owned here on their own.
+            return False
+        for key, exam, first, last in items:
+            self.outbox.record(shard_of(exam), key, first, last, chat_id, "inflight", self.attempts.get((key, last, chat_id), 0))
+
+    async def _delivered(self, chat_id, items, priority, on_settled, ok):
+        now = datetime.datetime.now()
+        retry, rounds = [], 0
+        for item in items:
+            key, exam, first, last = item
+            if not self._owns(exam):
+                # Shard handed over: its new owner replays the ledger
+                if on_settled:
+                    on_settled(False, 1)
+                continue
+            ident = key, last, chat_id
+            live = exam.course or self.pending.get(key) is exam
+            attempts = self.attempts.get(ident, 0)
+            if not ok and live and attempts < REMINDER_ATTEMPTS and now < exam.time + REMINDER_GRACE:
+                retry.append(item)
+                rounds = max(rounds, attempts)
+                continue
+            if ok and metrics.enabled:
+                lag = now - (exam.time - REMINDER_OFFSETS[last])
+                metrics.observe("bot_reminder_lag_seconds", lag.total_seconds(), offset=int(REMINDER_OFFSETS[last].total_seconds()))
+            if not ok:
+                logging.error(f"Giving up on reminder {last} for exam '{exam.message}' to chat {chat_id} after {attempts} attempts")
+            self.outbox.record(shard_of(exam), key, first, last, chat_id, "delivered" if ok else "failed", attempts)
+            self.attempts.pop(ident, None)
+            if live and not exam.course:
+                self._settle(key, exam, first, last)
+            if on_settled:
+                on_settled(ok, 1)
+        if retry:
+            delay = REMINDER_RETRY.total_seconds() * 2 ** (rounds - 1)
+            asyncio.get_running_loop().call_later(delay, self._retry, chat_id, retry, priority, on_settled)
+        self.wakeup.set()
+
+    def _retry(self, chat_id, items, priority, on_settled):
+        live = [
+            item for item in items
+            if self._owns(item[1]) and (item[1].course or self.pending.get(item[0]) is item[1])
+        ]
+        if on_settled and len(live) < len(items):
+            on_settled(False, len(items) - len(live))
+        if live:
+            self._send(chat_id, live, priority=priority, on_settled=on_settled)
+            self.outbox.sync()
+
+    def _settle(self, key, exam, first, last):
+        for i in range(first, last + 1):
+            exam.mark_sent(i)
+        self.delivered.append(exam)
+        if not self._push_next(key, exam, last + 1):
+            self.pending.pop(key, None)
+
+scheduler = ReminderScheduler()
+
+def save_schedule_snapshot(path, exams, signature):
+    """Write the scheduler's exams as plain tuples, tagged with the store's signature."""
+    rows = [(e.id, e.chat_id, e.time.isoformat(), e.message, e.sent, e.course) for e in exams]
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        marshal.dump((signature, rows), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_schedule_snapshot(path, signature):
+    """Exams from a snapshot, or None if there is none or the store changed since."""
+    try:
+        with open(path, "rb") as f:
+            # One read: marshal.load() on a file reads it a few bytes at a time
+            saved, rows = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if saved != signature:
+        return None
+    fromiso = datetime.datetime.fromisoformat
+    return [Exam(chat_id, fromiso(t), message, sent, course, exam_id) for exam_id, chat_id, t, message, sent, course in rows]
+
 async def reminder_loop(app):
-    import logging
     logging.basicConfig(level=logging.INFO)
-    while True:
-        exams = load_exams()
-        now = datetime.datetime.now()
-        changed = False
-        for exam in exams:
-            reminder_time = datetime.datetime.fromisoformat(exam["time"])
-            chat_id = exam["chat_id"]
-            message = exam["message"]
-            if "sent" not in exam:
-                exam["sent"] = [False, False, False, False]
-            reminder_times = get_reminder_times(reminder_time)
-            reminder_texts = get_reminder_texts(message, reminder_time)
-            for i, (rt, txt) in enumerate(zip(reminder_times, reminder_texts)):
-                if not exam["sent"][i] and rt <= now < reminder_time + datetime.timedelta(hours=1):
-                    logging.info(f"Sending reminder {i} for exam '{message}' to chat {chat_id} at {now.strftime('%Y-%m-%d %H:%M:%S')}")
-                    try:
-                        # Extract details for UI
-                        exam_time_str = reminder_time.strftime('%A, %d %B %Y at %I:%M %p')
-                        mode = ''
-                        if '(' in message and message.endswith(')'):
-                            mode = message.split('(')[-1].rstrip(')')
-                        subject = message.split('(')[0].strip() if '(' in message else message
-                        # Friendly Markdown message
-                        notif = (
-                            f"{txt}\n\n"
-                            f"*Subject:* {subject}\n"
-                            f"*Date & Time:* `{exam_time_str}`\n"
-                            f"*Mode:* {mode if mode else 'N/A'}\n"
-                        )
-                        # Inline button for details (opens external link)
-                        from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-                        import urllib.parse
-                        # Build URL with query params
-                        base_url = "https://sts.ug.edu.gh/timetable/"
-                        params = {
-                            "subject": subject,
-                            "datetime": exam_time_str,
-                            "mode": mode
-                        }
-                        url = base_url + "?" + urllib.parse.urlencode(params)
-                        keyboard = InlineKeyboardMarkup([
-                            [InlineKeyboardButton("View Exam Details", url=url)]
-                        ])
-                        await app.bot.send_message(
-                            chat_id=chat_id,
-                            text=notif,
-                            parse_mode="Markdown",
-                            reply_markup=keyboard
-                        )
-                        exam["sent"][i] = True
-                        changed = True
-                    except Exception as e:
-                        logging.error(f"Failed to send reminder: {e}")
-        if changed:
-            save_exams(exams)
-        await asyncio.sleep(10)
+    send_queue.start(app.bot)
+    start = time.perf_counter()
+    since = datetime.datetime.now() - CATCHUP_LOOKBACK
+    exams = None
+    if SCHEDULE_SNAPSHOT and WORKERS == 1:
+        exams = await asyncio.to_thread(load_schedule_snapshot, SCHEDULE_SNAPSHOT, store.signature())
+    source = "snapshot"
+    if exams is None:
+        source = "store"
+        exams = await store.upcoming(since)
+    else:
+        exams = exams[bisect.bisect_left(exams, since, key=lambda e: e.time):]
+    await scheduler.load(exams)
+    store.preload()
+    elapsed = time.perf_counter() - start
+    metrics.observe("bot_reminder_load_seconds", elapsed)
+    logging.info(f"Reminder index ready: {len(scheduler.pending)} exams from the {source} in {elapsed:.2f}s")
+    # Drain missed reminders alongside the live ones; catch_up() sends at a
+    # lower priority, so reminders falling due now are not held behind it
+    catching_up = asyncio.create_task(scheduler.catch_up())
+    try:
+        await scheduler.run(app)
+    finally:
+        catching_up.cancel()
+
+reminder_task = None
+
+async def start_reminder(app):
+    global reminder_task
+    # Neither the store nor the reminder index is needed to answer most
+    # updates, so both are built in the background after startup. With a
+    # snapshot, reminder_loop() starts the store read once the index is up,
+    # so the two do not compete for the interpreter
+    if not SCHEDULE_SNAPSHOT:
+        store.preload()
+    reminder_task = asyncio.create_task(reminder_loop(app))
+
+async def stop_reminder(app):
+    if reminder_task:
+        reminder_task.cancel()
+        try:
+            await reminder_task
+        except asyncio.CancelledError:
+            pass
+    await send_queue.stop()
+    await scheduler.flush()
+    scheduler.outbox.close()
+    exams = None
+    if SCHEDULE_SNAPSHOT and scheduler.ready.is_set():
+        exams = await store.upcoming(datetime.datetime.now() - CATCHUP_LOOKBACK)
+    await store.close()
+    if exams is not None:
+        # After close(), so the signature covers the final files
+        save_schedule_snapshot(SCHEDULE_SNAPSHOT, exams, store.signature())
+
+
+# ---------------- Rendering ----------------
+def pretty_date(dt):
+    day = dt.day
+    suffix = 'th' if 11 <= day <= 13 else {1:'st',2:'nd',3:'rd'}.get(day%10, 'th')
+    return f"{day}{suffix} {dt.strftime('%B %Y (%I:%M %p)')}"
+
+class ExamView(NamedTuple):
+    """An exam with its reminder times and display strings."""
+    exam: Exam
+    reminder_times: list
+    date_str: str
+    reminders_str: str
+
+def render_exam(exam):
+    reminder_times = get_reminder_times(exam.time)
+    reminders_str = ", ".join(f"`{pretty_date(rt)}`" for rt in reminder_times)
+    return ExamView(exam, reminder_times, pretty_date(exam.time), reminders_str)
+
+# Exams per /myexams page
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "10"))
+
+class ChatView:
+    """Rendered exam listings of one chat, each built on first use.
+
+    Exams are rendered one by one as a listing needs them, so a /myexams
+    page costs PAGE_SIZE renders however many exams the chat has.
+    """
+
+    def __init__(self, exams):
+        self.exams = exams
+        self._rendered = {}   # index -> ExamView
+        self._pages = {}      # page -> (msg, markup)
+        self._next_exam = None
+        self._today = None
+
+    def render(self, index):
+        v = self._rendered.get(index)
+        if v is None:
+            v = self._rendered[index] = render_exam(self.exams[index])
+        return v
+
+    def page_count(self):
+        return max(1, -(-len(self.exams) // PAGE_SIZE))
+
+    def my_exams(self, page=0):
+        pages = self.page_count()
+        page = max(0, min(page, pages - 1))
+        if page not in self._pages:
+            title = "📌 *Your upcoming exams:*"
+            if pages > 1:
+                title += f" _(page {page + 1}/{pages})_"
+            lines = [title + "\n\n"]
+            buttons = []
+            courses = set()
+            for i in range(page * PAGE_SIZE, min((page + 1) * PAGE_SIZE, len(self.exams))):
+                v = self.render(i)
+                lines.append(
+                    f"*{i + 1}.* `{v.date_str}` — {v.exam.message}\n"
+                    f"   ⏳ _Reminders:_ {v.reminders_str}\n\n"
+                )
+                if not v.exam.course:
+                    buttons.append([InlineKeyboardButton(f"❌ Delete {i + 1}", callback_data=f"del_{v.exam.id}")])
+                elif v.exam.course not in courses:
+                    courses.add(v.exam.course)
+                    buttons.append([InlineKeyboardButton(f"🔕 Unsubscribe {clip(v.exam.course)}", callback_data=f"unsub_{course_tag(v.exam.course)}")])
+            nav = []
+            if page > 0:
+                nav.append(InlineKeyboardButton("◀️ Prev", callback_data=f"page_{page - 1}"))
+            if page < pages - 1:
+                nav.append(InlineKeyboardButton("Next ▶️", callback_data=f"page_{page + 1}"))
+            if nav:
+                buttons.append(nav)
+            self._pages[page] = ("".join(lines), InlineKeyboardMarkup(buttons) if buttons else None)
+        return self._pages[page]
+
+    def next_exam(self):
+        if self._next_exam is None:
+            v = self.render(min(range(len(self.exams)), key=lambda i: self.exams[i].time))
+            self._next_exam = (
+                "🎯 *Your next exam:*\n"
+                f"*Subject:* {v.exam.message}\n"
+                f"*Date:* `{v.date_str}`\n"
+                f"⏳ _Reminders:_ {v.reminders_str}"
+            )
+        return self._next_exam
+
+    def today(self, date):
+        if self._today is None or self._today[0] != date:
+            lines = [
+                f"📝 `{v.date_str}` — {v.exam.message}\n"
+                f"   ⏳ _Reminders:_ {v.reminders_str}\n\n"
+                for v in (self.render(i) for i, e in enumerate(self.exams) if e.time.date() == date)
+            ]
+            msg = "📅 *Exams happening today:*\n\n" + "".join(lines) if lines else None
+            self._today = (date, msg)
+        return self._today[1]
+
+# Number of chats whose rendered listings are kept in memory
+VIEW_CACHE_SIZE = int(os.getenv("VIEW_CACHE_SIZE", "10000"))
+
+class ViewCache:
+    """Per-chat ChatView cache, dropped by the store whenever a chat's exams change."""
+
+    def __init__(self):
+        self.views = {}
+        self.generation = 0
+
+    async def get(self, chat_id):
+        view = self.views.pop(chat_id, None)
+        if view is None:
+            generation = self.generation
+            view = ChatView(await store.for_chat(chat_id) + await store.subscribed(chat_id))
+            if generation != self.generation:
+                # The chat changed while we were loading it; don't cache
+                return view
+            if len(self.views) >= VIEW_CACHE_SIZE:
+                del self.views[next(iter(self.views))]
+        # Re-insert so dict order doubles as LRU order
+        self.views[chat_id] = view
+        return view
+
+    def invalidate(self, chat_id):
+        self.generation += 1
+        self.views.pop(chat_id, None)
+
+views = ViewCache()
+
+
+# ---------------- Timetable parsing ----------------
+MONTHS = {}
+for _i, _name in enumerate(["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"], start=1):
+    MONTHS[_name.lower()] = MONTHS[_name[:3].lower()] = _i
+MONTHS["sept"] = 9
+# Date answer of the guided /newexam flow, e.g. "29th August 2025"
+GUIDED_DATE = re.compile(r"(\d+)[a-z]* ([A-Za-z]+) (\d{4})")
+
+_DATE = (
+    r"(?:(?P<iso>\d{4}-\d{1,2}-\d{1,2})"
+    r"|(?P<month>[A-Za-z]{3,9})\.?\s+(?P<day>\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(?P<year>\d{4}))?"
+    r"|(?P<day2>\d{1,2})(?:st|nd|rd|th)?\s+(?P<month2>[A-Za-z]{3,9})\.?(?:,?\s+(?P<year2>\d{4}))?)"
+)
+_TIME = r"(?P<hour>\d{1,2})(?:[:.](?P<minute>\d{2}))?\s*(?P<ampm>[AaPp]\.?[Mm]\.?)?"
+# subject–Month Day(th)(HH:MM[am|pm])–(Location); en dash, em dash or hyphen between fields
+TIMETABLE_LINE = re.compile(
+    rf"(?P<subject>.+?)\s*[–—-]\s*{_DATE}\s*,?\s*(?:at\s+)?\(?\s*{_TIME}\s*\)?\s*(?:[–—-]\s*(?P<location>.*))?"
+)
+TIMETABLE_DATE = re.compile(_DATE)
+TIMETABLE_TIME = re.compile(_TIME)
+
+class TimetableResult(NamedTuple):
+    exams: list
+    failed: list
+
+def _timetable_datetime(date, time, default_year):
+    """Build a datetime from TIMETABLE_DATE and TIMETABLE_TIME match groups."""
+    if date["iso"]:
+        year, month, day = map(int, date["iso"].split("-"))
+    else:
+        month = MONTHS[(date["month"] or date["month2"]).lower()]
+        day = int(date["day"] or date["day2"])
+        year = int(date["year"] or date["year2"] or default_year)
+    hour, minute, ampm = time["hour"], time["minute"], time["ampm"]
+    if minute is None and ampm is None:
+        raise ValueError("Ambiguous time")
+    hour, minute = int(hour), int(minute or 0)
+    if ampm:
+        if not 1 <= hour <= 12:
+            raise ValueError("Invalid 12-hour time")
+        hour = hour % 12 + (12 if ampm[0] in "Pp" else 0)
+    return datetime.datetime(year, month, day, hour, minute)
+
+def _timetable_row(line, default_year):
+    match = TIMETABLE_LINE.fullmatch(line)
+    if match:
+        groups = match.groupdict()
+        return groups["subject"], _timetable_datetime(groups, groups, default_year), (groups["location"] or "").strip()
+    # CSV/TSV: subject, date, time[, location]
+    delimiter = "\t" if "\t" in line else ","
+    return _timetable_fields(next(csv.reader([line], delimiter=delimiter)), default_year)
+
+def _timetable_fields(fields, default_year):
+    fields = [f.strip() for f in fields]
+    if not fields or fields[0].lower() in ("subject", "course"):
+        return None  # header row
+    if len(fields) < 3:
+        raise ValueError("Invalid format")
+    date = TIMETABLE_DATE.fullmatch(fields[1])
+    time = TIMETABLE_TIME.fullmatch(fields[2])
+    if not date or not time:
+        raise ValueError("Invalid date/time format")
+    return fields[0], _timetable_datetime(date.groupdict(), time.groupdict(), default_year), " ".join(fields[3:])
+
+def parse_timetable(text, chat_id, year=None, catalog=False):
+    """Parse a pasted timetable, one exam per line, into Exam records.
+
+    With catalog=True the records are course catalog exams keyed by subject.
+    """
+    year = year or datetime.datetime.now().year
+    exams, failed = [], []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = _timetable_row(line, year)
+        except (ValueError, KeyError, csv.Error):
+            failed.append(line)
+            continue
+        if row is None:
+            continue
+        subject, dt, location = row
+        exams.append(Exam(chat_id, dt, f"{subject} {location}".strip(), course=normalize_course(subject) if catalog else None))
+    return TimetableResult(exams, failed)
+
+# Uploaded timetables are capped so one file can't flood the store
+MAX_IMPORT_BYTES = 1024 * 1024
+MAX_IMPORT_ROWS = 2000
+
+def parse_csv_file(f, chat_id, year=None):
+    """Stream subject,date,time[,location] rows from an open CSV/TSV file."""
+    year = year or datetime.datetime.now().year
+    exams, failed = [], []
+    first = f.readline()
+    delimiter = "\t" if "\t" in first else ","
+    for fields in csv.reader(itertools.chain([first], f), delimiter=delimiter):
+        if not any(field.strip() for field in fields):
+            continue
+        if len(exams) + len(failed) >= MAX_IMPORT_ROWS:
+            failed.append(f"…rows after {MAX_IMPORT_ROWS} were not read")
+            break
+        try:
+            row = _timetable_fields(fields, year)
+        except (ValueError, KeyError):
+            failed.append(delimiter.join(fields))
+            continue
+        if row is None:
+            continue
+        subject, dt, location = row
+        exams.append(Exam(chat_id, dt, f"{subject} {location}".strip()))
+    return TimetableResult(exams, failed)
+
+ICS_ESCAPE = re.compile(r"\\([\\;,nN])")
+
+def _ics_lines(f):
+    """Unfold iCalendar content lines while streaming the file."""
+    current = None
+    for raw in f:
+        raw = raw.rstrip("\r\n")
+        if raw[:1] in (" ", "\t") and current is not None:
+            current += raw[1:]
+            continue
+        if current is not None:
+            yield current
+        current = raw
+    if current is not None:
+        yield current
+
+def _ics_text(value):
+    return ICS_ESCAPE.sub(lambda m: " " if m.group(1) in "nN" else m.group(1), value).strip()
+
+def _ics_datetime(params, value):
+    if "T" not in value:
+        raise ValueError("All-day event")
+    dt = datetime.datetime.strptime(value.rstrip("Z")[:15], "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        # UTC; store local time like every other exam. TZID values are taken as local.
+        dt = dt.replace(tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+    return dt
+
+def parse_ics_file(f, chat_id):
+    """Stream VEVENTs (SUMMARY, DTSTART, LOCATION) from an open .ics file."""
+    exams, failed = [], []
+    event = None
+    for line in _ics_lines(f):
+        name, _, value = line.partition(":")
+        name, _, params = name.partition(";")
+        name = name.upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event = {}
+        elif name == "END" and value.upper() == "VEVENT" and event is not None:
+            if len(exams) + len(failed) >= MAX_IMPORT_ROWS:
+                failed.append(f"…events after {MAX_IMPORT_ROWS} were not read")
+                break
+            summary = _ics_text(event.get("SUMMARY", ("", ""))[1])
+            try:
+                if not summary or "DTSTART" not in event:
+                    raise ValueError("Missing SUMMARY or DTSTART")
+                dt = _ics_datetime(*event["DTSTART"])
+            except ValueError:
+                failed.append(summary or "event without a summary")
+            else:
+                location = _ics_text(event.get("LOCATION", ("", ""))[1])
+                exams.append(Exam(chat_id, dt, f"{summary} {location}".strip()))
+            event = None
+        elif event is not None and name in ("SUMMARY", "DTSTART", "LOCATION"):
+            event[name] = (params, value)
+    return TimetableResult(exams, failed)
 
 
 # ---------------- Bot Commands ----------------
@@ -200,269 +1986,636 @@ async def start(update, context):
         "• `/myexams` — View all your exams\n"
         "• `/deleteexam <number>` — Remove a saved exam\n"
         "• `/nextexam` — Show your closest upcoming exam\n"
-        "• `/today` — Show exams happening today\n",
+        "• `/today` — Show exams happening today\n"
+        "• `/subscribe <course>` — Follow a published course timetable\n"
+        "• Send a `.csv` or `.ics` file — Import a whole timetable\n",
         parse_mode="Markdown",
         reply_markup=reply_markup
     )
 
 async def add_exam(update, context):
-    # Use full message text for bulk entry
-    full_text = update.message.text
-    # Remove command part
-    lines = full_text.split('\n')
-    # Remove the command from the first line
-    if lines:
-        if lines[0].startswith('/addexam'):
-            lines[0] = lines[0][len('/addexam'):].strip()
-    # Remove empty lines and strip
-    lines = [line.strip() for line in lines if line.strip()]
-    exams = load_exams()
-    added, failed = [], []
-
-    import re
-    from datetime import datetime
-    months = {m: i+1 for i, m in enumerate(["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"])}
-    current_year = datetime.now().year
-
-    for line in lines:
-        try:
-            # Custom format: subject–Month Day(th)(HH:MM[am|pm])–(Location)
-            parts = [p.strip() for p in re.split(r"–", line)]
-            if len(parts) < 2:
-                raise ValueError("Invalid format")
-            subject = parts[0]
-            # Extract date and time, support AM/PM
-            date_time_match = re.match(r"([A-Za-z]+) (\d+)[a-z]*\((\d{1,2}:\d{2}(?: ?[AaPp][Mm])?)\)", parts[1])
-            if not date_time_match:
-                raise ValueError("Invalid date/time format")
-            month_str, day_str, time_str = date_time_match.groups()
-            month = months.get(month_str)
-            day = int(day_str)
-            # Parse time with AM/PM
-            time_str = time_str.replace(' ', '')
-            if re.search(r'[AaPp][Mm]$', time_str):
-                dt = datetime.strptime(f"{current_year} {month} {day} {time_str}", "%Y %m %d %I:%M%p")
+    # Use full message text for bulk entry, minus the command itself
+    text = update.message.text
+    if text.startswith('/addexam'):
+        text = text[len('/addexam'):]
+    result = parse_timetable(text, update.effective_chat.id)
+
+    # One batched write for the whole paste
+    await store.add_many(result.exams)
+    for exam in result.exams:
+        scheduler.add(exam)
+
+    await update.message.reply_text(render_timetable_result(result), parse_mode="Markdown")
+
+async def import_timetable(update, context):
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_IMPORT_BYTES:
+        await update.message.reply_text("⚠️ That file is too large. Please upload a timetable under 1 MB.")
+        return
+    tg_file = await document.get_file()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = await tg_file.download_to_drive(os.path.join(tmp, "timetable"))
+        with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+            if (document.file_name or "").lower().endswith(".ics"):
+                result = parse_ics_file(f, update.effective_chat.id)
             else:
-                hour, minute = map(int, time_str.split(":"))
-                dt = datetime(current_year, month, day, hour, minute)
-            reminder_time = dt
-            location = parts[2] if len(parts) > 2 else ""
-            message = f"{subject} {location}".strip()
-            exams.append({
-                "chat_id": update.effective_chat.id,
-                "time": reminder_time.isoformat(),
-                "message": message
-            })
-            added.append(f"`{reminder_time}` — {message}")
-        except Exception:
-            failed.append(line)
+                result = parse_csv_file(f, update.effective_chat.id)
+
+    await store.add_many(result.exams)
+    for exam in result.exams:
+        scheduler.add(exam)
+
+    await update.message.reply_text(render_import_summary(document.file_name or "file", result), parse_mode="Markdown")
 
-    save_exams(exams)
+# Telegram rejects messages over 4096 characters, so replies list a few
+# exams and echo a few rejected lines, each cut to ECHO_WIDTH characters
+ECHO_WIDTH = 80
 
-    def pretty_date(dt):
-        day = dt.day
-        suffix = 'th' if 11 <= day <= 13 else {1:'st',2:'nd',3:'rd'}.get(day%10, 'th')
-        return f"{day}{suffix} {dt.strftime('%B %Y')} ({dt.strftime('%I:%M %p')})"
+def clip(line):
+    return line if len(line) <= ECHO_WIDTH else line[:ECHO_WIDTH - 1] + "…"
 
+def render_import_summary(file_name, result, shown=10):
+    if not result.exams and not result.failed:
+        return "📭 No exams found in that file."
     reply = ""
-    if added:
+    if result.exams:
+        reply += f"✅ *Imported {len(result.exams)} exams from* `{file_name}`\n"
+        reply += "".join(f"{pretty_date(exam.time)} — {exam.message}\n" for exam in result.exams[:shown])
+        if len(result.exams) > shown:
+            reply += f"_…and {len(result.exams) - shown} more (see /myexams)_\n"
+    if result.failed:
+        reply += f"\n⚠️ *Skipped {len(result.failed)} rows:*\n" + "\n".join(map(clip, result.failed[:shown])) + "\n"
+        if file_name.lower().endswith(".ics"):
+            reply += "_Events need a SUMMARY and a DTSTART with a time._"
+        else:
+            reply += "_CSV columns: subject, date, time, location_"
+    return reply
+
+def render_timetable_result(result, shown=10):
+    reply = ""
+    if result.exams:
         reply += "✅ *Exams saved:*\n"
-        for exam in added:
-            # exam is like '`2025-08-29 19:30:00` — 312 (Online)'
-            try:
-                dt_str = exam.split(' — ')[0].replace('`','').strip()
-                dt = datetime.fromisoformat(dt_str)
-                reply += f"{pretty_date(dt)} — {exam.split(' — ')[-1]}\n"
-            except Exception:
-                reply += exam + "\n"
+        reply += "".join(f"{pretty_date(exam.time)} — {clip(exam.message)}\n" for exam in result.exams[:shown])
+        if len(result.exams) > shown:
+            reply += f"_…and {len(result.exams) - shown} more (see /myexams)_\n"
         reply += ("\n_You’ll be reminded 3 days before, a day before, an hour before, and at the start._")
-    if failed:
-        reply += "\n⚠️ *Failed to add:*\n" + "\n".join(failed) + "\n_Format: 312–August 29th(7:30pm)–(Online)_"
+    if result.failed:
+        reply += "\n⚠️ *Failed to add:*\n" + "\n".join(map(clip, result.failed[:shown])) + "\n"
+        if len(result.failed) > shown:
+            reply += f"_…and {len(result.failed) - shown} more lines_\n"
+        reply += "_Format: 312–August 29th(7:30pm)–(Online)_"
     if not reply.strip():
         reply = "No exams were added. Please check your input format."
-    await update.message.reply_text(reply, parse_mode="Markdown")
+    return reply
 
 async def my_exams(update, context):
-    exams = load_exams()
-    chat_exams = [e for e in exams if e["chat_id"] == update.effective_chat.id]
+    view = await views.get(update.effective_chat.id)
 
-    if not chat_exams:
+    if not view.exams:
         await update.message.reply_text("📭 No exams saved yet.")
         return
 
-    msg = "📌 *Your upcoming exams:*\n\n"
-    buttons = []
-    def pretty_date(dt):
-        day = dt.day
-        suffix = 'th' if 11 <= day <= 13 else {1:'st',2:'nd',3:'rd'}.get(day%10, 'th')
-        return f"{day}{suffix} {dt.strftime('%B %Y')} ({dt.strftime('%I:%M %p')})"
-
-    for i, e in enumerate(chat_exams, start=1):
-        reminder_time = datetime.datetime.fromisoformat(e["time"])
-        msg += f"*{i}.* `{pretty_date(reminder_time)}` — {e['message']}\n"
-        msg += f"   ⏳ _Reminders:_ `{pretty_date(reminder_time - datetime.timedelta(days=3))}`, "
-        msg += f"`{pretty_date(reminder_time - datetime.timedelta(days=1))}`, "
-        msg += f"`{pretty_date(reminder_time - datetime.timedelta(hours=1))}`, "
-        msg += f"`{pretty_date(reminder_time)}`\n\n"
-        buttons.append([InlineKeyboardButton(f"❌ Delete {i}", callback_data=f"delete_exam_{i-1}")])
-
-    reply_markup = InlineKeyboardMarkup(buttons) if buttons else None
-    # Telegram max message length is 4096 chars
-    MAX_LEN = 4000
-    if len(msg) <= MAX_LEN:
-        await update.message.reply_text(msg, parse_mode="Markdown", reply_markup=reply_markup)
-    else:
-        # Split message into chunks
-        chunks = [msg[i:i+MAX_LEN] for i in range(0, len(msg), MAX_LEN)]
-        # Send first chunk with buttons, rest without
-        await update.message.reply_text(chunks[0], parse_mode="Markdown", reply_markup=reply_markup)
-        for chunk in chunks[1:]:
-            await update.message.reply_text(chunk, parse_mode="Markdown")
-
-# Callback handler for inline delete
+    # One page at a time keeps every message well under Telegram's 4096 chars
+    msg, reply_markup = view.my_exams()
+    await update.message.reply_text(msg, parse_mode="Markdown", reply_markup=reply_markup)
+
+async def remove_exam(chat_id, exam_id):
+    """Delete one of the chat's own exams by ID; returns it, or None if it is already gone."""
+    removed = await store.remove(chat_id, exam_id)
+    if removed is not None and all(e.key != removed.key for e in await store.for_chat(chat_id)):
+        scheduler.remove(removed)
+    return removed
+
+# Callback handler for inline buttons: delete, unsubscribe and /myexams pages
 async def inline_delete_exam(update, context):
     query = update.callback_query
     await query.answer()
     data = query.data
-    if data.startswith("delete_exam_"):
-        index = int(data.split("_")[-1])
-        exams = load_exams()
-        chat_exams = [e for e in exams if e["chat_id"] == query.message.chat.id]
-        if index < 0 or index >= len(chat_exams):
-            await query.edit_message_text("⚠️ Invalid exam number. Use /myexams to see valid numbers.")
+    if data.startswith("del_"):
+        removed = await remove_exam(query.message.chat.id, int(data[len("del_"):]))
+        if removed is None:
+            await query.edit_message_text("⚠️ That exam was already deleted. Use /myexams to see your exams.")
             return
-        exam_to_delete = chat_exams[index]
-        exams.remove(exam_to_delete)
-        save_exams(exams)
         await query.edit_message_text(
-            f"❌ *Deleted exam:* {exam_to_delete['message']}\n*Date:* `{datetime.datetime.fromisoformat(exam_to_delete['time']).strftime('%Y-%m-%d %H:%M')}`",
+            f"❌ *Deleted exam:* {removed.message}\n*Date:* `{removed.time.strftime('%Y-%m-%d %H:%M')}`",
             parse_mode="Markdown"
         )
+    elif data.startswith("page_"):
+        view = await views.get(query.message.chat.id)
+        if not view.exams:
+            await query.edit_message_text("📭 No exams saved yet.")
+            return
+        msg, reply_markup = view.my_exams(int(data[len("page_"):]))
+        try:
+            await query.edit_message_text(msg, parse_mode="Markdown", reply_markup=reply_markup)
+        except BadRequest as e:
+            # A double tap asks for the page that is already shown
+            if "not modified" not in str(e):
+                raise
+    elif data.startswith("delete_exam_"):
+        # Positional buttons from before exam IDs could hit the wrong exam
+        await query.edit_message_text("⚠️ This list is out of date. Use /myexams for a fresh one.")
+    elif data.startswith("unsub_"):
+        chat_id = query.message.chat.id
+        tag = data[len("unsub_"):]
+        codes = {e.course for e in await store.subscribed(chat_id)}
+        code = next((code for code in codes if course_tag(code) == tag), None)
+        if code is not None and await store.unsubscribe(chat_id, code):
+            await query.edit_message_text(f"🔕 Unsubscribed from {clip(code)}.")
+        else:
+            await query.edit_message_text("⚠️ You are no longer subscribed to that course. Use /myexams for a fresh list.")
+    elif data.startswith("unsubscribe_"):
+        # Buttons from before course tags carry the code itself
+        code = data[len("unsubscribe_"):]
+        if await store.unsubscribe(query.message.chat.id, code):
+            await query.edit_message_text(f"🔕 Unsubscribed from {code}.")
+        else:
+            await query.edit_message_text(f"⚠️ You are not subscribed to {code}.")
 async def delete_exam(update, context):
     try:
         index = int(context.args[0]) - 1
-        exams = load_exams()
-        chat_exams = [e for e in exams if e["chat_id"] == update.effective_chat.id]
-
-        if index < 0 or index >= len(chat_exams):
+        view = await views.get(update.effective_chat.id)
+        if index < 0 or index >= len(view.exams):
+            await update.message.reply_text("⚠️ Invalid exam number. Use /myexams to see valid numbers.")
+            return
+        listed = view.exams[index]
+        if listed.course:
+            # Subscribed course exams go away with /unsubscribe
+            await update.message.reply_text(f"⚠️ That exam is part of your {listed.course} subscription. Use /unsubscribe {listed.course} instead.")
+            return
+        if await remove_exam(update.effective_chat.id, listed.id) is None:
             await update.message.reply_text("⚠️ Invalid exam number. Use /myexams to see valid numbers.")
             return
 
-        exam_to_delete = chat_exams[index]
-        exams.remove(exam_to_delete)
-        save_exams(exams)
-
-        reminder_time = datetime.datetime.fromisoformat(exam_to_delete['time'])
-        def pretty_date(dt):
-            day = dt.day
-            suffix = 'th' if 11 <= day <= 13 else {1:'st',2:'nd',3:'rd'}.get(day%10, 'th')
-            return f"{day}{suffix} {dt.strftime('%B %Y')} ({dt.strftime('%I:%M %p')})"
         await update.message.reply_text(
-            f"❌ *Deleted exam:* {exam_to_delete['message']}\n*Date:* `{pretty_date(reminder_time)}`",
+            f"❌ *Deleted exam:* {listed.message}\n*Date:* `{pretty_date(listed.time)}`",
             parse_mode="Markdown"
         )
     except:
         await update.message.reply_text("⚠️ Use format: /deleteexam <number> (check with /myexams)")
 
 async def nextexam(update, context):
-    exams = load_exams()
-    chat_exams = [e for e in exams if e["chat_id"] == update.effective_chat.id]
+    view = await views.get(update.effective_chat.id)
 
-    if not chat_exams:
+    if not view.exams:
         await update.message.reply_text("📭 No exams saved yet.")
         return
 
-    # Sort by soonest exam
-    chat_exams.sort(key=lambda e: datetime.datetime.fromisoformat(e["time"]))
-    next_exam = chat_exams[0]
-    reminder_time = datetime.datetime.fromisoformat(next_exam["time"])
-
-    msg = "🎯 *Your next exam:*\n"
-    def pretty_date(dt):
-        day = dt.day
-        suffix = 'th' if 11 <= day <= 13 else {1:'st',2:'nd',3:'rd'}.get(day%10, 'th')
-        return f"{day}{suffix} {dt.strftime('%B %Y')} ({dt.strftime('%I:%M %p')})"
-    msg += f"*Subject:* {next_exam['message']}\n"
-    msg += f"*Date:* `{pretty_date(reminder_time)}`\n"
-    msg += f"⏳ _Reminders:_ `{pretty_date(reminder_time - datetime.timedelta(days=3))}`, "
-    msg += f"`{pretty_date(reminder_time - datetime.timedelta(days=1))}`, "
-    msg += f"`{pretty_date(reminder_time - datetime.timedelta(hours=1))}`, "
-    msg += f"`{pretty_date(reminder_time)}`"
-
-    await update.message.reply_text(msg, parse_mode="Markdown")
+    await update.message.reply_text(view.next_exam(), parse_mode="Markdown")
 
 async def today(update, context):
-    exams = load_exams()
-    chat_exams = [e for e in exams if e["chat_id"] == update.effective_chat.id]
-
-    today_date = datetime.datetime.now().date()
-    today_exams = [e for e in chat_exams if datetime.datetime.fromisoformat(e["time"]).date() == today_date]
+    view = await views.get(update.effective_chat.id)
+    msg = view.today(datetime.datetime.now().date())
 
-    if not today_exams:
+    if not msg:
         await update.message.reply_text("📭 No exams scheduled for today.")
         return
 
-    msg = "📅 *Exams happening today:*\n\n"
-    def pretty_date(dt):
-        day = dt.day
-        suffix = 'th' if 11 <= day <= 13 else {1:'st',2:'nd',3:'rd'}.get(day%10, 'th')
-        return f"{day}{suffix} {dt.strftime('%B %Y')} ({dt.strftime('%I:%M %p')})"
-    for e in today_exams:
-        reminder_time = datetime.datetime.fromisoformat(e["time"])
-        msg += f"📝 `{pretty_date(reminder_time)}` — {e['message']}\n"
-        msg += f"   ⏳ _Reminders:_ `{pretty_date(reminder_time - datetime.timedelta(days=3))}`, "
-        msg += f"`{pretty_date(reminder_time - datetime.timedelta(days=1))}`, "
-        msg += f"`{pretty_date(reminder_time - datetime.timedelta(hours=1))}`, "
-        msg += f"`{pretty_date(reminder_time)}`\n\n"
+    await update.message.reply_text(msg, parse_mode="Markdown")
 
+# ---------------- Course catalog ----------------
+# Chats allowed to publish and withdraw catalog exams. A published exam
+# reaches every subscriber, so publishing is off unless this is set
+ADMIN_IDS = {int(i) for i in os.getenv("ADMIN_IDS", "").split(",") if i.strip()}
+
+async def add_course(update, context):
+    if update.effective_chat.id not in ADMIN_IDS:
+        await update.message.reply_text("⚠️ Only timetable admins can publish course exams.")
+        return
+    text = update.message.text
+    if text.startswith('/addcourse'):
+        text = text[len('/addcourse'):]
+    result = parse_timetable(text, None, catalog=True)
+    added = await store.add_course_exams(result.exams)
+    for exam in added:
+        scheduler.add(exam)
+
+    reply = ""
+    shown = 10
+    if added:
+        reply += "✅ *Published:*\n"
+        reply += "".join(f"`{clip(exam.course)}` — {pretty_date(exam.time)} — {clip(exam.message)}\n" for exam in added[:shown])
+        if len(added) > shown:
+            reply += f"_…and {len(added) - shown} more_\n"
+        reply += "\n_Students can now /subscribe to these course codes._"
+    if len(added) < len(result.exams):
+        reply += f"\n_{len(result.exams) - len(added)} exams were already published._"
+    if result.failed:
+        reply += "\n⚠️ *Failed to add:*\n" + "\n".join(map(clip, result.failed[:shown])) + "\n"
+        if len(result.failed) > shown:
+            reply += f"_…and {len(result.failed) - shown} more lines_\n"
+        reply += "_Format: 312–August 29th(7:30pm)–(Online)_"
+    if not reply.strip():
+        reply = "No exams were published. Please check your input format."
+    await update.message.reply_text(reply.strip(), parse_mode="Markdown")
+
+async def remove_course(update, context):
+    if update.effective_chat.id not in ADMIN_IDS:
+        await update.message.reply_text("⚠️ Only timetable admins can withdraw course exams.")
+        return
+    args = list(context.args or [])
+    which = None
+    if len(args) > 1 and (args[-1].isdigit() or args[-1].lower() == "all"):
+        which = args.pop().lower()
+    if not args:
+        await update.message.reply_text("⚠️ Use format: /removecourse <course code> [number|all]")
+        return
+    code = normalize_course(" ".join(args))
+    exams = sorted(await store.course_exams(code), key=lambda e: e.time)
+    if not exams:
+        await update.message.reply_text(f"📭 No exams have been published for {clip(code)}.")
+        return
+    if which is None:
+        msg = f"📚 *Published exams for {clip(code)}:*\n"
+        msg += "".join(f"{i}. {pretty_date(exam.time)} — {clip(exam.message)}\n" for i, exam in enumerate(exams, 1))
+        msg += f"\n_Withdraw one with /removecourse {code} <number>, or all with /removecourse {code} all._"
+        await update.message.reply_text(msg, parse_mode="Markdown")
+        return
+    if which == "all":
+        chosen = exams
+    elif 1 <= int(which) <= len(exams):
+        chosen = [exams[int(which) - 1]]
+    else:
+        await update.message.reply_text(f"⚠️ Invalid exam number. Use /removecourse {code} to see valid numbers.")
+        return
+    removed = await store.remove_course_exams(code, {exam.key for exam in chosen})
+    for exam in removed:
+        scheduler.remove(exam)
+    msg = f"🗑 *Withdrew {len(removed)} {clip(code)} exam(s):*\n"
+    msg += "".join(f"{pretty_date(exam.time)} — {clip(exam.message)}\n" for exam in removed)
     await update.message.reply_text(msg, parse_mode="Markdown")
 
+async def subscribe(update, context):
+    if not context.args:
+        await update.message.reply_text("⚠️ Use format: /subscribe <course code>, e.g. /subscribe 312")
+        return
+    code = normalize_course(" ".join(context.args))
+    exams = await store.course_exams(code)
+    if not exams:
+        await update.message.reply_text(f"📭 No exams have been published for {code} yet.")
+        return
+    await store.subscribe(update.effective_chat.id, code)
+    msg = f"🔔 *Subscribed to {code}:*\n"
+    msg += "".join(f"`{pretty_date(exam.time)}` — {exam.message}\n" for exam in sorted(exams, key=lambda e: e.time))
+    msg += "\n_You’ll get the usual reminders for these exams. Use /unsubscribe to stop._"
+    await update.message.reply_text(msg, parse_mode="Markdown")
+
+async def unsubscribe(update, context):
+    if not context.args:
+        await update.message.reply_text("⚠️ Use format: /unsubscribe <course code>")
+        return
+    code = normalize_course(" ".join(context.args))
+    if await store.unsubscribe(update.effective_chat.id, code):
+        await update.message.reply_text(f"🔕 Unsubscribed from {code}.")
+    else:
+        await update.message.reply_text(f"⚠️ You are not subscribed to {code}.")
+
+
+# ---------------- Worker cluster ----------------
+# WORKERS > 1 runs one front-end process that receives updates and N worker
+# processes that handle them. Updates and reminders are partitioned by chat
+# (or course) into WORKERS shards; shard ownership is leased in EXAMS_DB so
+# exactly one worker schedules each shard, and a dead worker's shards are
+# taken over once its lease expires.
+WORKERS = int(os.getenv("WORKERS", "1"))
+LEASE_TTL = 30
+
+def chat_shard(chat_id):
+    return chat_id % WORKERS
+
+def shard_of(exam):
+    if exam.course:
+        return zlib.crc32(exam.course.encode()) % WORKERS
+    return chat_shard(exam.chat_id)
+
+class ShardLeases:
+    """Shard ownership leases shared by all workers through a SQLite file."""
+
+    def __init__(self, path, index):
+        import sqlite3
+        self.db = sqlite3.connect(path, timeout=10, isolation_level=None)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                shard INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS workers (
+                idx INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                seen REAL NOT NULL
+            );
+            """
+        )
+        self.index = index
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.held = set()
+        self.catch_ups = set()
+        self.course_keys = None  # keys of the course exams seen by the last sync
+        # Give the other workers one lease period to register before taking their shards
+        self.steal_after = time.time() + LEASE_TTL
+
+    def step(self):
+        """Renew, take over and hand back leases.
+
+        Returns (gained, handback, lost). Shards in handback belong to a
+        worker that is alive again and must be released with release().
+        """
+        now = time.time()
+        gained, handback, lost = [], [], []
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.execute("INSERT OR REPLACE INTO workers (idx, owner, seen) VALUES (?, ?, ?)", (self.index, self.owner, now))
+            alive = {idx for (idx,) in self.db.execute("SELECT idx FROM workers WHERE seen >= ?", (now - LEASE_TTL,))}
+            for shard in range(WORKERS):
+                if shard != self.index and (shard in alive or now < self.steal_after):
+                    if shard in self.held:
+                        handback.append(shard)
+                    continue
+                cursor = self.db.execute(
+                    "INSERT INTO leases (shard, owner, expires) VALUES (?, ?, ?) "
+                    "ON CONFLICT(shard) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                    "WHERE leases.owner = excluded.owner OR leases.expires < ? "
+                    "OR leases.owner NOT IN (SELECT owner FROM workers WHERE seen >= ?)",
+                    (shard, self.owner, now + LEASE_TTL, now, now - LEASE_TTL)
+                )
+                if cursor.rowcount and shard not in self.held:
+                    gained.append(shard)
+                elif not cursor.rowcount and shard in self.held:
+                    lost.append(shard)
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        self.held.update(gained)
+        self.held.difference_update(lost)
+        return gained, handback, lost
+
+    def release(self, shards):
+        for shard in shards:
+            self.db.execute("UPDATE leases SET expires = 0 WHERE shard = ? AND owner = ?", (shard, self.owner))
+            self.held.discard(shard)
+
+    def close(self):
+        self.release(list(self.held))
+        self.db.execute("DELETE FROM workers WHERE idx = ? AND owner = ?", (self.index, self.owner))
+        self.db.close()
+
+    async def run(self):
+        while True:
+            gained, handback, lost = self.step()
+            for shard in lost + handback:
+                logging.info(f"Worker {self.index} giving up shard {shard}")
+                scheduler.drop_shard(shard)
+            if handback:
+                # Sent flags must be on disk before the home worker reloads the shard
+                await scheduler.flush()
+                self.release(handback)
+            if gained:
+                logging.info(f"Worker {self.index} now owns shards {gained}")
+                exams = await store.upcoming(datetime.datetime.now() - CATCHUP_LOOKBACK)
+                for shard in gained:
+                    await scheduler.add_shard(shard, exams)
+                scheduler.ready.set()
+                scheduler.removed.clear()
+                # Drain in the background so the lease heartbeat keeps going
+                task = asyncio.create_task(scheduler.catch_up())
+                self.catch_ups.add(task)
+                task.add_done_callback(self.catch_ups.discard)
+            await self.sync_courses()
+            await asyncio.sleep(LEASE_TTL / 3)
+
+    async def sync_courses(self):
+        """Pick up catalog exams published or withdrawn through other workers.
+
+        Besides scheduling them, drop the cached views of their subscribers:
+        the store only invalidates views in the worker that made the change.
+        """
+        exams = await store.upcoming_courses(datetime.datetime.now() - CATCHUP_LOOKBACK)
+        if self.held:
+            scheduler.sync_courses(exams)
+        keys = {exam.key for exam in exams}
+        if self.course_keys is not None:
+            for code in {key[0] for key in keys ^ self.course_keys}:
+                for chat_id in await store.subscribers_of(code):
+                    views.invalidate(chat_id)
+        self.course_keys = keys
+
+def worker_main(index, updates):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(index, updates))
+
+async def run_worker(index, updates):
+    from telegram import Update
+    if metrics.enabled:
+        # Each worker has its own numbers; the front end only routes updates
+        serve_metrics(METRICS_PORT + 1 + index)
+    app = build_application(updater=None)
+    add_handlers(app)
+    leases = ShardLeases(EXAMS_DB, index)
+    scheduler.shards = set()
+    loop = asyncio.get_running_loop()
+    async with app:
+        await app.start()
+        send_queue.start(app.bot)
+        tasks = [asyncio.create_task(scheduler.run(app)), asyncio.create_task(leases.run())]
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await app.update_queue.put(Update.de_json(data, app.bot))
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await send_queue.stop()
+        await scheduler.flush()
+        scheduler.outbox.close()
+        await app.stop()
+    await store.close()
+    leases.close()
+
+class WorkerPool:
+    """Front-end side of the cluster: routes updates to worker processes and restarts dead ones."""
+
+    def __init__(self, count):
+        import multiprocessing
+        self.ctx = multiprocessing.get_context("spawn")
+        self.queues = [None] * count
+        self.procs = [None] * count
+        self.task = None
+
+    def _spawn(self, index):
+        # A fresh queue each time: a killed reader can leave the old one locked
+        self.queues[index] = self.ctx.Queue()
+        proc = self.ctx.Process(target=worker_main, args=(index, self.queues[index]), daemon=True)
+        proc.start()
+        self.procs[index] = proc
+
+    async def start(self, app):
+        for index in range(len(self.procs)):
+            self._spawn(index)
+        self.task = asyncio.create_task(self._supervise())
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(5)
+            for index, proc in enumerate(self.procs):
+                if not proc.is_alive():
+                    logging.warning(f"Worker {index} exited with {proc.exitcode}, restarting")
+                    self._spawn(index)
+
+    async def dispatch(self, update, context):
+        if update.effective_chat:
+            chat_id = update.effective_chat.id
+        else:
+            chat_id = update.effective_user.id if update.effective_user else 0
+        self.queues[chat_shard(chat_id)].put(update.to_dict())
+
+    async def stop(self, app):
+        if self.task:
+            self.task.cancel()
+        for queue in self.queues:
+            queue.put(None)
+        for proc in self.procs:
+            await asyncio.to_thread(proc.join, 15)
+            if proc.is_alive():
+                proc.terminate()
+
+def run_cluster():
+    from telegram import Update
+    from telegram.ext import TypeHandler
+    logging.basicConfig(level=logging.INFO)
+    if EXAM_STORE != "sqlite":
+        raise SystemExit("WORKERS > 1 needs the shared SQLite store: set EXAM_STORE=sqlite")
+    pool = WorkerPool(WORKERS)
+    app = build_application(post_init=pool.start, post_shutdown=pool.stop)
+    app.add_handler(TypeHandler(Update, pool.dispatch))
+    run_application(app)
+
+
 # ---------------- Main ----------------
-def main():
-    reminder_task = None
-    async def start_reminder(app):
-        nonlocal reminder_task
-        reminder_task = asyncio.create_task(reminder_loop(app))
-    async def stop_reminder(app):
-        if reminder_task:
-            reminder_task.cancel()
-            try:
-                await reminder_task
-            except asyncio.CancelledError:
-                pass
-    app = Application.builder().token(TOKEN).post_init(start_reminder).build()
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("addexam", add_exam))
-    app.add_handler(CommandHandler("myexams", my_exams))
-    app.add_handler(CommandHandler("deleteexam", delete_exam))
-    app.add_handler(CommandHandler("nextexam", nextexam))
-    app.add_handler(CommandHandler("today", today))
-    app.add_handler(CallbackQueryHandler(inline_delete_exam))
+# Point the bot at another Bot API server, e.g. fake_telegram.py for local testing
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+def build_application(post_init=None, post_shutdown=None, updater=False):
+    builder = Application.builder().token(TOKEN)
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL).base_file_url(TELEGRAM_API_URL.replace("/bot", "/file/bot"))
+    if post_init:
+        builder = builder.post_init(post_init)
+    if post_shutdown:
+        builder = builder.post_shutdown(post_shutdown)
+    if updater is None:
+        builder = builder.updater(None)
+    return builder.build()
+
+def add_handlers(app):
+    # Identity unless METRICS is on, so disabled metrics cost nothing per update
+    def timed(callback):
+        return metrics.timed("bot_handler_seconds", callback, handler=callback.__name__)
+    app.add_handler(CommandHandler("start", timed(start)))
+    app.add_handler(CommandHandler("addexam", timed(add_exam)))
+    app.add_handler(CommandHandler("myexams", timed(my_exams)))
+    app.add_handler(CommandHandler("deleteexam", timed(delete_exam)))
+    app.add_handler(CommandHandler("nextexam", timed(nextexam)))
+    app.add_handler(CommandHandler("today", timed(today)))
+    app.add_handler(CommandHandler("addcourse", timed(add_course)))
+    app.add_handler(CommandHandler("removecourse", timed(remove_course)))
+    app.add_handler(CommandHandler("subscribe", timed(subscribe)))
+    app.add_handler(CommandHandler("unsubscribe", timed(unsubscribe)))
+    app.add_handler(CallbackQueryHandler(timed(inline_delete_exam)))
     # Guided exam addition
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('newexam', newexam_start)],
+        entry_points=[CommandHandler('newexam', timed(newexam_start))],
         states={
-            EXAM_SUBJECT: [MessageHandler(filters.TEXT & ~filters.COMMAND, newexam_subject)],
-            EXAM_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, newexam_date)],
-            EXAM_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, newexam_time)],
-            EXAM_LOCATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, newexam_location)],
+            EXAM_SUBJECT: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(newexam_subject))],
+            EXAM_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(newexam_date))],
+            EXAM_TIME: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(newexam_time))],
+            EXAM_LOCATION: [MessageHandler(filters.TEXT & ~filters.COMMAND, timed(newexam_location))],
         },
-        fallbacks=[CommandHandler('cancel', newexam_cancel)]
+        fallbacks=[CommandHandler('cancel', timed(newexam_cancel))]
     )
     app.add_handler(conv_handler)
-    app.add_handler(MessageHandler(filters.COMMAND | filters.TEXT, unknown))
+    app.add_handler(MessageHandler(filters.Document.FileExtension("csv") | filters.Document.FileExtension("ics"), timed(import_timetable)))
+    app.add_handler(MessageHandler(filters.COMMAND | filters.TEXT, timed(unknown)))
+
+async def run_webhook_with_metrics(app, port, url_path, webhook_url):
+    """app.run_webhook() plus a /metrics route on the same port.
+
+    PTB's webhook server takes no extra routes, so this serves both from
+    one tornado app and drives the Application lifecycle itself.
+    """
+    import signal
+    import tornado.web
+    # The handler app.run_webhook() mounts: checks Content-Type and rejects
+    # bodies that are not an Update before anything reaches the queue
+    from telegram.ext._utils.webhookhandler import TelegramHandler
+
+    class MetricsHandler(tornado.web.RequestHandler):
+        def get(self):
+            self.set_header("Content-Type", "text/plain; version=0.0.4")
+            self.write(metrics.render())
+
+    web = tornado.web.Application(
+        [
+            (f"/{url_path}", TelegramHandler, {"bot": app.bot, "update_queue": app.update_queue, "secret_token": None}),
+            ("/metrics", MetricsHandler),
+        ],
+        # The default access log prints the request path, and the path is the bot token
+        log_function=lambda handler: None,
+    )
+    server = web.listen(port, "0.0.0.0")
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+    try:
+        await app.initialize()
+        if app.post_init:
+            await app.post_init(app)
+        await app.bot.set_webhook(webhook_url)
+        await app.start()
+        await stop.wait()
+    finally:
+        server.stop()
+        if app.running:
+            await app.stop()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+        await app.shutdown()
+
+def run_application(app):
     # Conditional deployment: webhook for Render, polling for local
     if os.getenv("RENDER") or os.getenv("PORT"):
         # Use webhooks for Render deployment
+        port = int(os.getenv("PORT", "10000"))
+        webhook_url = f"https://telegrambot-dhnl.onrender.com/{TOKEN}"
+        if metrics.enabled:
+            asyncio.run(run_webhook_with_metrics(app, port, TOKEN, webhook_url))
+            return
         app.run_webhook(
             listen="0.0.0.0",
-            port=int(os.getenv("PORT", "10000")),
+            port=port,
             url_path=TOKEN,
-            webhook_url=f"https://telegrambot-dhnl.onrender.com/{TOKEN}"
+            webhook_url=webhook_url
         )
     else:
         # Local development: use polling
+        if metrics.enabled:
+            serve_metrics(METRICS_PORT)
         app.run_polling()
 
+def main():
+    if WORKERS > 1:
+        return run_cluster()
+    app = build_application(post_init=start_reminder, post_shutdown=stop_reminder)
+    add_handlers(app)
+    run_application(app)
+
 if __name__ == "__main__":
-    main()
+    import sys
+    if sys.argv[1:2] == ["migrate"]:
+        # python main.py migrate [exams.json] [exams.db]
+        print(f"Migrated {migrate_json_to_sqlite(*sys.argv[2:4])} exams")
+    else:
+        main()
@@ -0,0 +1,161 @@
+"""Behaviour tests for the exam bot: timetable parsing and exam IDs.
+
+Run with `python -m pytest -q`. Every test works in its own temporary
+directory, so exams.json and the ledger in the checkout are never touched.
+"""
+import asyncio, datetime, json, os
+
+import pytest
+
+os.environ.setdefault("TOKEN", "123:test")
+import main
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, "EXAMS_FILE", str(tmp_path / "exams.json"))
+    monkeypatch.setattr(main, "COURSES_FILE", str(tmp_path / "courses.json"))
+    monkeypatch.setattr(main, "EXAM_IDS_FILE", str(tmp_path / "exam_ids.json"))
+    return tmp_path
+
+
+def parse(text, **kwargs):
+    return main.parse_timetable(text, 1, year=2026, **kwargs)
+
+
+# ---------------- Timetable parsing ----------------
+@pytest.mark.parametrize("line, when, message", [
+    ("312–August 29th(7:30pm)–(Online)", datetime.datetime(2026, 8, 29, 19, 30), "312 (Online)"),
+    ("312—August 29th(7:30pm)—(Online)", datetime.datetime(2026, 8, 29, 19, 30), "312 (Online)"),
+    ("CS-101 - Sept. 5 (09:00) - Room B", datetime.datetime(2026, 9, 5, 9, 0), "CS-101 Room B"),
+    ("304 - 3rd Oct 2027 at 2pm", datetime.datetime(2027, 10, 3, 14, 0), "304"),
+    ("306 – 2026-12-01 12:00am – Hall", datetime.datetime(2026, 12, 1, 0, 0), "306 Hall"),
+    ("MATH 101,2026-10-05,14:15,Great Hall", datetime.datetime(2026, 10, 5, 14, 15), "MATH 101 Great Hall"),
+    ("STAT 1\t5 October 2026\t9.30am\tJQB 19", datetime.datetime(2026, 10, 5, 9, 30), "STAT 1 JQB 19"),
+])
+def test_parse_formats(line, when, message):
+    result = parse(line)
+    assert result.failed == []
+    assert [(e.time, e.message) for e in result.exams] == [(when, message)]
+
+
+@pytest.mark.parametrize("line", [
+    "312–August 29th(7)–(Online)",      # hour without minutes or am/pm
+    "312–August 29th(13:00pm)–(Online)",
+    "312–Augtober 29th(7:30pm)–(Online)",
+    "312–February 30th(7:30pm)–(Online)",
+    "MATH 101,2026-10-05",
+    "not a timetable line",
+])
+def test_parse_failures(line):
+    result = parse(line)
+    assert result.exams == []
+    assert result.failed == [line]
+
+
+def test_parse_skips_headers_and_blank_lines():
+    result = parse("subject,date,time,location\n\n  \nMATH 101,2026-10-05,14:15,Great Hall\n")
+    assert len(result.exams) == 1
+    assert result.failed == []
+
+
+def test_parse_catalog_normalizes_course():
+    exam, = parse("cs  101–August 29th(7:30pm)–(Online)", catalog=True).exams
+    assert exam.course == "CS 101"
+    assert exam.chat_id == 1
+
+
+def test_parse_csv_file_caps_rows(tmp_path):
+    path = tmp_path / "timetable.csv"
+    path.write_text("".join(f"MATH {i},2026-10-05,14:15,Hall\n" for i in range(main.MAX_IMPORT_ROWS + 5)))
+    with open(path, newline="") as f:
+        result = main.parse_csv_file(f, 1)
+    assert len(result.exams) == main.MAX_IMPORT_ROWS
+    assert result.failed == [f"…rows after {main.MAX_IMPORT_ROWS} were not read"]
+
+
+# ---------------- Exam IDs ----------------
+LEGACY = [
+    {"chat_id": 7, "time": "2026-08-29T07:30:00", "message": "312 (Online)"},
+    {"chat_id": 7, "time": "2026-08-31T11:30:00", "message": "302 Online"},
+    {"id": 1, "chat_id": 8, "time": "2026-09-01T07:30:00", "message": "304 Online"},
+    {"id": 1, "chat_id": 8, "time": "2026-09-05T07:30:00", "message": "306 Online"},
+]
+
+
+def test_assign_exam_ids_keeps_valid_ids_and_renumbers_the_rest():
+    entries = [dict(e) for e in LEGACY]
+    assert main.assign_exam_ids(entries) == (5, True)
+    assert [e["id"] for e in entries] == [2, 3, 1, 4]
+    assert main.assign_exam_ids(entries) == (5, False)
+    # A saved high-water mark wins over the IDs still in the file
+    assert main.assign_exam_ids([{"chat_id": 7, "time": "2026-08-29T07:30:00", "message": "x"}], 9) == (10, True)
+
+
+def test_json_store_migrates_ids_on_load(workdir):
+    (workdir / "exams.json").write_text(json.dumps(LEGACY))
+
+    async def load():
+        store = main.JsonExamStore()
+        return {e.message: e.id for e in await store.all()}
+
+    ids = asyncio.run(load())
+    assert ids == {"312 (Online)": 2, "302 Online": 3, "304 Online": 1, "306 Online": 4}
+    # Written back, so buttons keep working after the next restart
+    assert [e["id"] for e in json.loads((workdir / "exams.json").read_text())] == [2, 3, 1, 4]
+
+
+def exam(message, chat_id=7):
+    return main.Exam(chat_id, datetime.datetime(2026, 10, 5, 9, 0), message)
+
+
+def test_json_store_ids_survive_restart(workdir):
+    async def before():
+        store = main.JsonExamStore()
+        await store.add_many([exam("A"), exam("B"), exam("C")])
+        await store.remove(7, 3)
+        await store.close()
+
+    async def after():
+        store = main.JsonExamStore()
+        new = exam("NEW")
+        await store.add(new)
+        await store.close()
+        return new.id, await store.get(3)
+
+    asyncio.run(before())
+    # The deleted exam's ID is not handed out again, so an old del_3 button misses
+    assert asyncio.run(after()) == (4, None)
+
+
+def test_migrate_to_sqlite_keeps_ids(workdir):
+    (workdir / "exams.json").write_text(json.dumps(LEGACY))
+    (workdir / "exam_ids.json").write_text(json.dumps({"next_id": 9}))
+    db_path = str(workdir / "exams.db")
+    assert main.migrate_json_to_sqlite(main.EXAMS_FILE, db_path, main.COURSES_FILE, main.EXAM_IDS_FILE) == len(LEGACY)
+
+    async def read():
+        db = main.SqliteExamStore(db_path)
+        try:
+            new = exam("NEW")
+            await db.add(new)
+            return {e.message: e.id for e in await db.all()}
+        finally:
+            await db.close()
+
+    assert asyncio.run(read()) == {"312 (Online)": 9, "302 Online": 10, "304 Online": 1, "306 Online": 11, "NEW": 12}
+    with pytest.raises(SystemExit):
+        main.migrate_json_to_sqlite(main.EXAMS_FILE, db_path, main.COURSES_FILE, main.EXAM_IDS_FILE)
+
+
+# ---------------- Reminder digests ----------------
+def test_long_digests_are_split_to_fit_a_message():
+    reminders = [(exam(f"COURSE {n} " + "x" * 60, chat_id=1), n % 4) for n in range(60)]
+    chunks = list(main.split_digest(reminders, lambda item: item))
+    assert len(chunks) > 1
+    assert [r for chunk in chunks for r in chunk] == reminders
+    for chunk in chunks:
+        notif, keyboard = main.build_digest(chunk)
+        assert len(notif) <= 4096
+        assert len(keyboard.inline_keyboard) <= main.DIGEST_MAX_ITEMS